@@ -0,0 +1,223 @@
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite в режиме WAL, общий для всех воркеров хоста.
+
+    Читатели в WAL не блокируют друг друга и писателя, поэтому чтение
+    почти не уступает LocMemCache, а записи видны всем процессам
+    gunicorn сразу. Время последнего обращения обновляется не чаще
+    раза в ACCESS_RESOLUTION секунд и служит для вытеснения по LRU,
+    когда записей становится больше MAX_ENTRIES.
+
+    LOCATION - путь к файлу базы. Дополнительные OPTIONS:
+    ACCESS_RESOLUTION (секунды), CULL_CHECK_PROBABILITY (доля записей,
+    после которых проверяется размер кэша).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        options = params.get('OPTIONS', {})
+        self.access_resolution = float(options.get('ACCESS_RESOLUTION', 10))
+        self.cull_check_probability = float(
+            options.get('CULL_CHECK_PROBABILITY', 0.01)
+        )
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        placeholders = ','.join('?' * len(keys))
+        rows = self.connection.execute(
+            'SELECT key, value, expires, accessed FROM cache'
+            f' WHERE key IN ({placeholders})',
+            keys,
+        ).fetchall()
+        now = time.time()
+        found, expired, touched = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > self.access_resolution:
+                touched.append(key)
+        if expired:
+            self._delete(expired)
+        if touched:
+            self.connection.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?',
+                [(now, key) for key in touched],
+            )
+        return found
+
+    def _store(self, items, timeout, mode='REPLACE'):
+        expires = self.get_backend_timeout(timeout)
+        if expires is not None and expires <= time.time():
+            self._delete([key for key, _ in items])
+            return 0
+        now = time.time()
+        cursor = self.connection.executemany(
+            f'INSERT OR {mode} INTO cache (key, value, expires, accessed)'
+            ' VALUES (?, ?, ?, ?)',
+            [
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 expires, now)
+                for key, value in items
+            ],
+        )
+        if random.random() < self.cull_check_probability:
+            self._cull()
+        return cursor.rowcount
+
+    def _delete(self, keys):
+        placeholders = ','.join('?' * len(keys))
+        cursor = self.connection.execute(
+            f'DELETE FROM cache WHERE key IN ({placeholders})', keys
+        )
+        return cursor.rowcount
+
+    def _cull(self):
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (count // self._cull_frequency,),
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._fetch(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store([(self._key(key, version), value)], timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        items = [(self._key(key, version), value)
+                 for key, value in data.items()]
+        if items:
+            with self._transaction():
+                self._store(items, timeout)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction():
+            self.connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            return self._store([(key, value)], timeout, mode='IGNORE') == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction():
+            value = self._fetch([key]).get(key)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            self.connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ?, accessed = ?'
+            ' WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), time.time(), key,
+             time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        self._delete([self._key(key, version)])
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._delete(keys)
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живет весь срок потока: открывать файл на каждый
+        # запрос дороже, чем держать его.
+        pass
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
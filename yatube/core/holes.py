@@ -0,0 +1,80 @@
+import re
+from urllib.parse import quote, unquote
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+FRAGMENTS = {}
+
+MARKER = '<!--hole:{name}{args}-->'
+MARKER_RE = re.compile(r'<!--hole:(\w+)((?:/[^/\s>]*)*)-->')
+
+
+def fragment(name, template_name):
+    """Регистрирует фрагмент страницы, который зависит от пользователя.
+
+    Декорируемая функция получает request и аргументы тега {% hole %}
+    строками и возвращает контекст для template_name.
+    """
+    def decorator(get_context):
+        FRAGMENTS[name] = (template_name, get_context)
+        return get_context
+    return decorator
+
+
+@fragment('header', 'includes/header_user.html')
+def header(request, view_name=''):
+    return {'view_name': view_name}
+
+
+@fragment('username', 'includes/username.html')
+def username(request):
+    return {}
+
+
+def render_fragment(request, name, args):
+    template_name, get_context = FRAGMENTS[name]
+    return render_to_string(
+        template_name, get_context(request, *args), request=request
+    )
+
+
+def make_marker(name, args):
+    return MARKER.format(
+        name=name,
+        args=''.join(
+            '/' + quote(str(arg), safe='').replace('-', '%2D')
+            for arg in args
+        ),
+    )
+
+
+def punch_holes(request):
+    """Следующий рендер вместо фрагментов оставит метки для fill_holes."""
+    request.punch_holes = True
+
+
+def fill_holes(request, response):
+    """Подставляет в общую закэшированную страницу фрагменты request.user.
+
+    Возвращается новый ответ с заголовками и cookies закэшированного:
+    сам закэшированный остается общим для всех.
+    """
+    content = MARKER_RE.sub(
+        lambda match: render_fragment(
+            request,
+            match[1],
+            [unquote(arg) for arg in match[2].split('/')[1:]],
+        ),
+        response.content.decode(response.charset),
+    )
+    filled = HttpResponse(
+        content,
+        status=response.status_code,
+        reason=response.reason_phrase,
+    )
+    for header, value in response.items():
+        if header.lower() != 'content-length':
+            filled[header] = value
+    filled.cookies.update(response.cookies)
+    return filled
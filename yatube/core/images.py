@@ -0,0 +1,219 @@
+import base64
+import json
+import logging
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageFilter, ImageOps
+
+from .signals import image_processed
+from .storage import release_file
+
+logger = logging.getLogger(__name__)
+
+ORIENTATION_TAG = 0x0112
+METADATA_KEYS = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+
+
+def describe_image(file):
+    """Размеры, формат и размер в байтах загруженного изображения.
+
+    Читается только заголовок файла, пиксели не декодируются.
+    """
+    position = file.tell()
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+            image_format = image.format or ''
+    finally:
+        file.seek(position)
+    return {
+        'width': width,
+        'height': height,
+        'format': image_format,
+        'bytes': file.size,
+    }
+
+
+def validate_upload(file):
+    """Проверяет размер загрузки в байтах и пикселях.
+
+    Вызывается из clean_<поле> форм после forms.ImageField, который уже
+    прочитал заголовок в file.image, так что изображение повторно не
+    открывается и не декодируется.
+    """
+    if file.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.IMAGE_UPLOAD_MAX_BYTES)},
+        )
+    width, height = file.image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValidationError(
+            'Изображение больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6},
+        )
+
+
+def needs_normalization(image):
+    return (
+        max(image.size) > settings.IMAGE_UPLOAD_MAX_SIDE
+        or image.getexif().get(ORIENTATION_TAG, 1) != 1
+        or any(key in image.info for key in METADATA_KEYS)
+        or image.format not in settings.IMAGE_UPLOAD_FORMATS
+    )
+
+
+def normalize_image(file):
+    """Нормализованная копия изображения: (ContentFile, расширение).
+
+    Поворачивает по EXIF, удаляет метаданные, кроме цветового профиля,
+    уменьшает до IMAGE_UPLOAD_MAX_SIDE по большей стороне и перекодирует
+    в JPEG, а изображения с прозрачностью в PNG. Возвращает None, если
+    изображение и так в порядке или анимировано.
+    """
+    max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+    file.seek(0)
+    with Image.open(file) as image:
+        if getattr(image, 'is_animated', False):
+            return None
+        if not needs_normalization(image):
+            return None
+        icc_profile = image.info.get('icc_profile')
+        # JPEG сразу декодируется в уменьшенном масштабе.
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    transparent = image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    if transparent:
+        image_format, extension = 'PNG', '.png'
+        image = image.convert('RGBA')
+    else:
+        image_format, extension = 'JPEG', '.jpg'
+        image = image.convert('RGB')
+    image.info.clear()
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        image_format,
+        quality=settings.IMAGE_UPLOAD_QUALITY,
+        optimize=True,
+        progressive=True,
+        icc_profile=icc_profile,
+    )
+    return ContentFile(buffer.getvalue()), extension
+
+
+def normalize_upload(instance, field_name):
+    """Заменяет загруженный файл поля нормализованной копией.
+
+    Запускается в фоне перед созданием миниатюр. Поле обновляется, только
+    если в нем все еще тот же файл: пока шла обработка, его могли
+    заменить новой загрузкой. Возвращает False, если файл уже заменен и
+    обрабатывать его дальше не нужно.
+    """
+    file = getattr(instance, field_name)
+    try:
+        with file.open('rb'):
+            normalized = normalize_image(file)
+    except (OSError, ValueError):
+        logger.exception('Не удалось нормализовать %s', file.name)
+        return True
+    if normalized is None:
+        return True
+    content, extension = normalized
+    old_name = file.name
+    stem = posixpath.splitext(posixpath.basename(old_name))[0]
+    name = file.storage.save(
+        file.field.generate_filename(instance, stem + extension), content
+    )
+    metadata = describe_image(content)
+    values = {field_name: name}
+    for key, value in metadata.items():
+        values[f'{field_name}_{key}'] = value
+    updated = type(instance)._default_manager.filter(
+        pk=instance.pk, **{field_name: old_name}
+    ).update(**values)
+    if not updated:
+        release_file(file.storage, name)
+        return False
+    for key, value in values.items():
+        setattr(instance, key, value)
+    release_file(file.storage, old_name)
+    return True
+
+
+def fill_image_metadata(instance, field_name):
+    """Обновляет поля <field_name>_width, _height, _format, _bytes и
+    _variants модели, если в поле загружен новый файл."""
+    file = getattr(instance, field_name)
+    if not file:
+        metadata = dict.fromkeys(('width', 'height', 'bytes'))
+        metadata['format'] = ''
+    elif not file._committed:
+        metadata = describe_image(file)
+    else:
+        return
+    metadata['variants'] = ''
+    if has_placeholder(instance, field_name):
+        metadata['placeholder'] = ''
+    for key, value in metadata.items():
+        setattr(instance, f'{field_name}_{key}', value)
+
+
+def has_placeholder(instance, field_name):
+    return hasattr(instance, f'{field_name}_placeholder')
+
+
+def make_placeholder(file):
+    """Крошечная размытая копия изображения в виде data URI.
+
+    Для JPEG декодер через draft сразу читает уменьшенную копию, так что
+    полное изображение в память не разворачивается.
+    """
+    size = settings.IMAGE_PLACEHOLDER_SIZE
+    file.seek(0)
+    with Image.open(file) as image:
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size))
+        image = image.filter(ImageFilter.GaussianBlur(1))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=40)
+    data = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/jpeg;base64,{data}'
+
+
+def get_variants(instance, field_name):
+    """Манифест созданных вариантов изображения: список словарей
+    name, geometry, width, height, format."""
+    manifest = getattr(instance, f'{field_name}_variants')
+    return json.loads(manifest) if manifest else []
+
+
+def save_image_fields(instance, field_name, variants, placeholder=None):
+    """Сохраняет манифест вариантов и заглушку без вызова save().
+
+    Сигнал image_processed дает приложениям сбросить страницы, которые
+    закэшированы еще без вариантов изображения.
+    """
+    values = {
+        f'{field_name}_variants': json.dumps(variants, separators=(',', ':'))
+    }
+    if placeholder is not None:
+        values[f'{field_name}_placeholder'] = placeholder
+    for name, value in values.items():
+        setattr(instance, name, value)
+    type(instance)._default_manager.filter(pk=instance.pk).update(**values)
+    image_processed.send(
+        sender=type(instance), instance=instance, field_name=field_name
+    )
@@ -0,0 +1,86 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+
+GENERATION_KEY = 'thumbnail_lru_generation'
+
+
+class LRUKVStore(KVStore):
+    """KV-хранилище sorl с LRU-кэшем в памяти процесса.
+
+    Найденные записи держатся в памяти не дольше THUMBNAIL_LRU_TIMEOUT
+    секунд, и кэш ограничен THUMBNAIL_LRU_SIZE записями. Промахи не
+    запоминаются: миниатюра, созданная другим воркером, будет найдена
+    при следующем обращении. Удаление записи повышает общее поколение в
+    кэше Django, и остальные воркеры сбрасывают свой LRU, заметив это не
+    позже чем через THUMBNAIL_LRU_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = None
+        self._checked = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._lru),
+        }
+
+    def _check_generation(self, now):
+        if now - self._checked < settings.THUMBNAIL_LRU_CHECK_INTERVAL:
+            return
+        self._checked = now
+        generation = self.cache.get(GENERATION_KEY)
+        if generation != self._generation:
+            self._generation = generation
+            self._lru.clear()
+
+    def _get_raw(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation(now)
+            entry = self._lru.get(key)
+            if entry is not None and entry[1] > now:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        value = super()._get_raw(key)
+        if value is not None:
+            self._remember(key, value, now)
+        return value
+
+    def _remember(self, key, value, now):
+        with self._lock:
+            self._lru[key] = (value, now + settings.THUMBNAIL_LRU_TIMEOUT)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value, time.monotonic())
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.cache.set(GENERATION_KEY, 1, None)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        with self._lock:
+            self._lru.clear()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+
+from core.cache import SQLiteCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает скорость чтения и записи LocMemCache и SQLiteCache '
+        'на страницах размером --size байт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--size', type=int, default=20000)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': LocMemCache('benchmark', {}),
+                'sqlite': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), {}
+                ),
+            }
+            self.stdout.write(
+                f'{"backend":<8}{"set, us":>10}{"get, us":>10}'
+                f'{"get_many(10), us":>18}{"miss, us":>10}'
+            )
+            for name, backend in backends.items():
+                self.stdout.write(
+                    f'{name:<8}'
+                    + ''.join(
+                        f'{value:>{width}.1f}'
+                        for value, width in zip(
+                            self.measure(backend, options), (10, 10, 18, 10)
+                        )
+                    )
+                )
+
+    def measure(self, backend, options):
+        keys = [f'page:{number}' for number in range(options['keys'])]
+        value = 'x' * options['size']
+        rounds = options['rounds']
+        operations = len(keys) * rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                backend.set(key, value, None)
+        set_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                backend.get(key)
+        get_time = time.perf_counter() - start
+
+        chunks = [keys[i:i + 10] for i in range(0, len(keys), 10)]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for chunk in chunks:
+                backend.get_many(chunk)
+        many_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                backend.get(f'missing:{key}')
+        miss_time = time.perf_counter() - start
+
+        return (
+            set_time / operations * 1e6,
+            get_time / operations * 1e6,
+            many_time / (len(chunks) * rounds) * 1e6,
+            miss_time / operations * 1e6,
+        )
@@ -0,0 +1,52 @@
+from core.media_gc import MediaCollector
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT исходные изображения, миниатюры и варианты, '
+        'на которые больше не ссылаются посты и профили, и устаревшие '
+        'записи KV-хранилища миниатюр.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, сколько места можно освободить.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько имен проверять одним запросом.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Не трогать файлы моложе этого числа секунд.',
+        )
+
+    def handle(self, *args, **options):
+        collector = MediaCollector(
+            batch_size=options['batch_size'],
+            min_age=options['min_age'],
+            dry_run=options['dry_run'],
+        )
+        report = collector.collect()
+        verb = 'Можно удалить' if options['dry_run'] else 'Удалено'
+        total = 0
+        for category, totals in report.items():
+            total += totals['bytes']
+            if totals['entries']:
+                self.stdout.write(
+                    f'{category}: {verb.lower()} {totals["entries"]} записей'
+                )
+            else:
+                self.stdout.write(
+                    f'{category}: {verb.lower()} {totals["files"]} файлов, '
+                    f'{filesizeformat(totals["bytes"])}'
+                )
+        self.stdout.write(f'{verb}: {filesizeformat(total)}')
@@ -0,0 +1,60 @@
+from core.images import describe_image
+from core.thumbnails import process_image
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет метаданные, создает миниатюры, манифест вариантов и '
+        'заглушки для изображений, загруженных до появления фоновой '
+        'обработки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Обработать и изображения, у которых манифест уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        for label in settings.THUMBNAIL_PRESETS:
+            app_label, model_name, field_name = label.split('.')
+            model = apps.get_model(app_label, model_name)
+            filled = self.fill_metadata(model, field_name, options['all'])
+            self.stdout.write(f'{label} metadata: {filled}')
+            objects = model._default_manager.exclude(**{field_name: ''})
+            if not options['all']:
+                objects = objects.filter(**{f'{field_name}_variants': ''})
+            processed = 0
+            for instance in objects.iterator():
+                process_image(
+                    instance, field_name, reuse=not options['all']
+                )
+                processed += 1
+            self.stdout.write(f'{label}: {processed}')
+
+    def fill_metadata(self, model, field_name, refresh=False):
+        """Размеры, формат и размер файлов, загруженных до появления полей
+        метаданных. Файлы читаются здесь, а не в миграции."""
+        objects = model._default_manager.exclude(
+            **{field_name: ''}
+        ).only('pk', field_name)
+        if not refresh:
+            objects = objects.filter(**{f'{field_name}_width__isnull': True})
+        filled = 0
+        for instance in objects.iterator():
+            file = getattr(instance, field_name)
+            try:
+                with file.open('rb'):
+                    metadata = describe_image(file)
+            except (OSError, ValueError):
+                continue
+            model._default_manager.filter(pk=instance.pk).update(**{
+                f'{field_name}_{key}': value
+                for key, value in metadata.items()
+            })
+            filled += 1
+        return filled
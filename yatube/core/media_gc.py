@@ -0,0 +1,249 @@
+import os
+import posixpath
+import time
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import FileField
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import StoredFile
+from .storage import TEMPORARY_PREFIX
+
+TEMPORARY_SUFFIXES = ('.lock', '.tmp')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def file_fields():
+    """(модель, имя поля, каталог upload_to или None) всех файловых
+    полей."""
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, FileField):
+                upload_to = field.upload_to
+                directory = (
+                    upload_to.strip('/') if isinstance(upload_to, str)
+                    else None
+                )
+                yield model, field.name, directory
+
+
+def referenced(names):
+    """Имена из names, на которые ссылается хотя бы одно файловое поле."""
+    found = set()
+    for model, field_name, _ in file_fields():
+        found.update(model._default_manager.filter(
+            **{f'{field_name}__in': names}
+        ).values_list(field_name, flat=True))
+    return found
+
+
+class MediaCollector:
+    """Сборщик файлов MEDIA_ROOT, на которые больше ничто не ссылается.
+
+    Дерево каталогов и записи KV-хранилища sorl обходятся потоком и
+    проверяются пачками по batch_size имен, так что память не зависит от
+    числа файлов. Файлы моложе min_age секунд не трогаются: их могла
+    только что записать загрузка, которая еще не закоммитила ссылку.
+    Сборку можно прервать и запустить снова в любой момент.
+    """
+
+    def __init__(self, batch_size=500, min_age=3600, dry_run=False):
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.root = settings.MEDIA_ROOT
+        self.report = {}
+
+    def collect(self):
+        self.report = {}
+        self.collect_originals()
+        self.collect_thumbnail_entries()
+        self.collect_thumbnail_files()
+        self.collect_resized()
+        return self.report
+
+    def _count(self, category, files=0, size=0, entries=0):
+        totals = self.report.setdefault(
+            category, {'files': 0, 'bytes': 0, 'entries': 0}
+        )
+        totals['files'] += files
+        totals['bytes'] += size
+        totals['entries'] += entries
+
+    def walk(self, directory):
+        """Имена старых файлов каталога относительно MEDIA_ROOT."""
+        stack = [os.path.join(self.root, directory)]
+        cutoff = time.time() - self.min_age
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.stat().st_mtime < cutoff:
+                        name = os.path.relpath(entry.path, self.root)
+                        yield name.replace(os.sep, '/')
+
+    def remove(self, category, names):
+        """Удаляет файлы, повторно проверив их возраст перед удалением."""
+        removed = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if time.time() - stat.st_mtime < self.min_age:
+                continue
+            if not self.dry_run:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                self._prune_dirs(os.path.dirname(path))
+            self._count(category, files=1, size=stat.st_size)
+            removed.append(name)
+        return removed
+
+    def _prune_dirs(self, directory):
+        while os.path.dirname(directory) != self.root.rstrip(os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def collect_originals(self):
+        """Исходные загрузки без ссылок и брошенные временные файлы."""
+        directories = {directory for _, _, directory in file_fields()}
+        directories.discard(None)
+        for directory in sorted(directories):
+            for names in batched(self.walk(directory), self.batch_size):
+                used = referenced(names)
+                removed = self.remove(
+                    'originals', [name for name in names if name not in used]
+                )
+                if removed and not self.dry_run:
+                    StoredFile.objects.filter(name__in=removed).delete()
+        if not os.path.isdir(self.root):
+            return
+        with os.scandir(self.root) as entries:
+            temporary = [
+                entry.name for entry in entries
+                if entry.name.startswith(TEMPORARY_PREFIX) and entry.is_file()
+            ]
+        self.remove('uploads', temporary)
+
+    def _load(self, raw_keys, identity):
+        values = KVStore.objects.filter(key__in=raw_keys).values_list(
+            'key', 'value'
+        )
+        load = deserialize_image_file if identity == 'image' else deserialize
+        return {key: load(value) for key, value in values}
+
+    def _source_entries(self):
+        """Записи KV исходных изображений, по ключам без OFFSET."""
+        prefix = add_prefix('', 'image')
+        last_key = prefix
+        while True:
+            batch = list(KVStore.objects.filter(
+                key__gt=last_key, key__startswith=prefix
+            ).order_by('key').values_list('key', 'value')[:self.batch_size])
+            if not batch:
+                return
+            last_key = batch[-1][0]
+            entries = [
+                (key, deserialize_image_file(value)) for key, value in batch
+            ]
+            yield [
+                (key, image) for key, image in entries
+                if not image.name.startswith(
+                    thumbnail_settings.THUMBNAIL_PREFIX
+                )
+            ]
+
+    def collect_thumbnail_entries(self):
+        """Миниатюры и записи KV изображений, на которые нет ссылок."""
+        for entries in self._source_entries():
+            if not entries:
+                continue
+            used = referenced([source.name for _, source in entries])
+            stale = [
+                (key, source) for key, source in entries
+                if source.name not in used
+            ]
+            if not stale:
+                continue
+            lists = self._load(
+                [add_prefix(source.key, 'thumbnails') for _, source in stale],
+                'thumbnails',
+            )
+            thumbnail_keys = [
+                add_prefix(key) for keys in lists.values() for key in keys
+            ]
+            thumbnails = self._load(thumbnail_keys, 'image')
+            self.remove(
+                'thumbnails',
+                [thumbnail.name for thumbnail in thumbnails.values()],
+            )
+            raw_keys = [key for key, _ in stale]
+            raw_keys.extend(lists)
+            raw_keys.extend(thumbnails)
+            self._count('kvstore', entries=len(raw_keys))
+            if not self.dry_run:
+                # Одно удаление на пачку, LRU воркеров сбросится один раз.
+                default.kvstore._delete_raw(*raw_keys)
+
+    def collect_thumbnail_files(self):
+        """Файлы миниатюр, о которых не знает KV-хранилище."""
+        directory = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+        for names in batched(self.walk(directory), self.batch_size):
+            keys = {
+                add_prefix(ImageFile(name, default.storage).key): name
+                for name in names
+            }
+            known = set(KVStore.objects.filter(
+                key__in=list(keys)
+            ).values_list('key', flat=True))
+            self.remove('thumbnails', [
+                name for key, name in keys.items() if key not in known
+            ])
+
+    def collect_resized(self):
+        """Варианты core.resize для удаленных исходников и их
+        брошенные блокировки и временные файлы."""
+        for names in batched(
+            self.walk(settings.RESIZE_CACHE_DIR), self.batch_size
+        ):
+            sources = {}
+            garbage = []
+            for name in names:
+                if name.endswith(TEMPORARY_SUFFIXES):
+                    garbage.append(name)
+                    continue
+                # resize/<шард>/<подпись>/<геометрия>/<исходник>
+                parts = name.split('/')
+                if len(parts) > 4:
+                    sources[name] = posixpath.join(*parts[4:])
+            used = referenced(list(set(sources.values())))
+            garbage.extend(
+                name for name, source in sources.items() if source not in used
+            )
+            self.remove('resized', garbage)
@@ -11,3 +11,25 @@ class CreatedModel(models.Model):
     class Meta:
         abstract = True
         ordering = ('-created',)
+
+
+class StoredFile(models.Model):
+    """Файл в хранилище core.storage.ContentAddressedStorage.
+
+    Одинаковые по содержимому загрузки хранятся одним файлом, references
+    считает, сколько полей моделей на него ссылаются.
+    """
+    name = models.CharField(
+        'Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    size = models.PositiveIntegerField('Размер в байтах')
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл хранилища'
+        verbose_name_plural = 'Файлы хранилища'
+
+    def __str__(self):
+        return self.name
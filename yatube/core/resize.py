@@ -0,0 +1,131 @@
+import fcntl
+import os
+import re
+import tempfile
+from contextlib import suppress
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, ImageOps
+
+GEOMETRY_RE = re.compile(r'^(\d{1,4})x(\d{1,4})$')
+SIGNATURE_SALT = 'core.resize'
+SIGNATURE_LENGTH = 16
+# Формат варианта выбирается по расширению имени: nginx отдает файл с
+# типом по расширению. Остальное (GIF, BMP, TIFF) сохраняется в PNG.
+OUTPUT_FORMATS = {
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.png': 'PNG',
+    '.webp': 'WEBP',
+}
+
+
+def sign(geometry, name):
+    value = f'{geometry}/{name}'
+    return salted_hmac(SIGNATURE_SALT, value).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def resize_url(name, geometry):
+    """Подписанный адрес варианта name размером geometry."""
+    return reverse('resize_image', kwargs={
+        'signature': sign(geometry, name),
+        'geometry': geometry,
+        'name': name,
+    })
+
+
+def parse_geometry(geometry):
+    match = GEOMETRY_RE.match(geometry)
+    if match is None:
+        return None
+    width, height = int(match[1]), int(match[2])
+    limit = settings.RESIZE_MAX_SIDE
+    if not (0 < width <= limit and 0 < height <= limit):
+        return None
+    return width, height
+
+
+def is_valid(signature, geometry, name):
+    return (
+        parse_geometry(geometry) is not None
+        and constant_time_compare(signature, sign(geometry, name))
+    )
+
+
+def cache_path(signature, geometry, name):
+    """Путь варианта в дисковом кэше.
+
+    Каталог шардируется по первым символам подписи, чтобы в одном
+    каталоге не копились тысячи вариантов. nginx отдает файл по тому же
+    правилу, не обращаясь к приложению.
+    """
+    return safe_join(
+        settings.MEDIA_ROOT,
+        settings.RESIZE_CACHE_DIR,
+        signature[:2],
+        signature,
+        geometry,
+        name,
+    )
+
+
+def output_format(name):
+    return OUTPUT_FORMATS.get(os.path.splitext(name)[1].lower(), 'PNG')
+
+
+def resize(source, target, size):
+    """Уменьшает и обрезает по центру, как {% thumbnail %} с
+    crop="center" upscale=True.
+
+    Формат задается явно через output_format: у многокадровых исходников
+    вроде MPO из камер телефонов Pillow не умеет писать собственный формат.
+    """
+    image_format = output_format(target)
+    with Image.open(source) as image:
+        image = ImageOps.fit(
+            ImageOps.exif_transpose(image), size, Image.LANCZOS
+        )
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(target), suffix='.tmp', delete=False
+    ) as temporary:
+        try:
+            image.save(temporary, image_format, quality=85)
+        except BaseException:
+            os.unlink(temporary.name)
+            raise
+    os.replace(temporary.name, target)
+
+
+def get_resized(signature, geometry, name):
+    """Возвращает путь готового варианта, создавая его при первом запросе.
+
+    Одновременные запросы одного варианта, в том числе из разных
+    процессов, ждут блокировки файла, и уменьшает изображение только
+    первый из них.
+    """
+    target = cache_path(signature, geometry, name)
+    if os.path.exists(target):
+        return target
+    source = safe_join(settings.MEDIA_ROOT, name)
+    if not os.path.isfile(source):
+        raise FileNotFoundError(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    lock_path = f'{target}.lock'
+    with open(lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(target):
+                resize(source, target, parse_geometry(geometry))
+                # Ждущие запросы найдут готовый файл и без блокировки.
+                with suppress(FileNotFoundError):
+                    os.unlink(lock_path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return target
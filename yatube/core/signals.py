@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Фоновая обработка изображения сохранила манифест вариантов и заглушку
+# через update(), минуя post_save. Аргументы: instance, field_name.
+image_processed = Signal()
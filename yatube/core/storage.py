@@ -0,0 +1,160 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+from contextlib import suppress
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+TEMPORARY_PREFIX = '.upload-'
+
+
+def content_name(directory, digest, extension):
+    """posts/ab/cd/abcd...ef.jpg: каталог upload_to, шарды и хэш."""
+    shards = [
+        digest[index * SHARD_WIDTH:(index + 1) * SHARD_WIDTH]
+        for index in range(SHARD_DEPTH)
+    ]
+    return posixpath.join(directory, *shards, digest + extension.lower())
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, которое называет файлы по SHA-256 содержимого.
+
+    Загрузка потоком пишется во временный файл рядом с MEDIA_ROOT и
+    одновременно хэшируется, поэтому в память целиком не читается.
+    Файлы раскладываются по вложенным каталогам по первым символам хэша,
+    одинаковые загрузки хранятся один раз, а число ссылок на файл
+    ведется в core.models.StoredFile. Файл удаляется из хранилища,
+    когда release снимает последнюю ссылку.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, суффиксы не нужны.
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1]
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(
+            dir=self.location, prefix=TEMPORARY_PREFIX, delete=False
+        ) as temporary:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temporary.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+        name = content_name(directory, digest.hexdigest(), extension)
+        try:
+            with transaction.atomic():
+                self._add_reference(name, size)
+                self._place(temporary.name, self.path(name))
+        finally:
+            with suppress(FileNotFoundError):
+                os.unlink(temporary.name)
+        return name
+
+    def _add_reference(self, name, size):
+        updated = StoredFile.objects.filter(name=name).update(
+            references=F('references') + 1
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, size=size, references=1)
+        except IntegrityError:
+            # Такой же файл одновременно загрузили в другом запросе.
+            StoredFile.objects.filter(name=name).update(
+                references=F('references') + 1
+            )
+
+    def _place(self, temporary_path, full_path):
+        try:
+            # Свежий mtime защищает файл от core.media_gc, пока ссылка
+            # на него еще не закоммичена.
+            os.utime(full_path)
+            return
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(full_path)
+        if self.directory_permissions_mode is not None:
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(
+                    directory, self.directory_permissions_mode, exist_ok=True
+                )
+            finally:
+                os.umask(old_umask)
+        else:
+            os.makedirs(directory, exist_ok=True)
+        # NamedTemporaryFile создается с правами 0600.
+        os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+        os.replace(temporary_path, full_path)
+
+    def release(self, name):
+        """Снимает ссылку на файл и удаляет его, если ссылок не осталось.
+
+        Файлы, которых нет в StoredFile (загруженные до появления
+        хранилища), не трогаются.
+        """
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name
+            ).first()
+            if stored is None:
+                return
+            if stored.references > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    references=F('references') - 1
+                )
+                return
+            stored.delete()
+            # Удаление под блокировкой строки: параллельная загрузка того
+            # же файла дождется коммита и запишет файл заново.
+            self.delete(name)
+
+
+def release_file(storage, name):
+    """Снимает ссылку на файл после коммита текущей транзакции."""
+    if name and hasattr(storage, 'release'):
+        transaction.on_commit(lambda: storage.release(name))
+
+
+def remember_file(instance, field_name):
+    """Перед save() запоминает прежний файл поля, если его заменят.
+
+    Повторная загрузка того же содержимого дает то же имя, но добавляет
+    ссылку, поэтому прежняя ссылка снимается при любой новой загрузке,
+    а не только при смене имени.
+    """
+    file = getattr(instance, field_name)
+    saved_name = None
+    if instance.pk and not (file and file._committed):
+        saved_name = type(instance)._default_manager.filter(
+            pk=instance.pk
+        ).values_list(field_name, flat=True).first()
+    setattr(instance, f'_saved_{field_name}', saved_name)
+
+
+def release_replaced_file(instance, field_name):
+    saved_name = getattr(instance, f'_saved_{field_name}', None)
+    if saved_name:
+        release_file(getattr(instance, field_name).storage, saved_name)
+
+
+def release_deleted_file(instance, field_name):
+    file = getattr(instance, field_name)
+    release_file(file.storage, file.name)
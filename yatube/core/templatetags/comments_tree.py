@@ -1,120 +1,147 @@
+import hashlib
+
 from django import template
-from django.utils.html import mark_safe
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.html import conditional_escape, mark_safe
 
 register = template.Library()
 
+LIST_OPEN = (
+    '<ul style="list-style-type:none;">'
+    '<div class="col-md-12 mt-2">'
+)
+LIST_CLOSE = '</div></ul>'
+
+COMMENT_CARD = """
+  <li>
+    <div class="card shadow-lg p-2 mb-2 bg-white rounded">
+      <div class="card shadow-lg p-2 mb-2 bg-white rounded">
+        <h5 class="mt-0">{author}</h5>
+        <hr>
+        <p>{text}</p>
+      </div>
+      <span
+        class="reply"
+        data-id="{id}"
+        data-parent="{parent_id}"
+        style="color:blue;cursor:pointer;">
+          <small>Ответить</small>
+          {delete_link}
+      </span>
+      <form
+        action=""
+        method="POST"
+        class="form-group mb-2"
+        id="form-{id}"
+        style="display:none;"
+      >
+        <textarea
+          type="text"
+          class="form-control"
+          name="comment-text"
+          id="{id}"></textarea>
+        <br>
+        <input
+          type="submit"
+          class="btn btn-primary submit-reply"
+          data-id="{id}"
+          data-submit-reply="{parent_id}"
+          value="Отправить"
+        >
+      </form>
+    </div>
+  </li>
+"""
+DELETE_LINK = '<a href="/posts/{id}/comment_delete/">x</a>'
+
+COMMENT_CACHE_KEY = 'comment_card:{id}:{version}:{owner:d}'
+
+
+def card_version(comment):
+    """Отпечаток всего, что выводит карточка комментария.
+
+    Правка текста, в том числе в админке, и смена имени автора дают
+    новый ключ, и устаревшая карточка больше не читается.
+    """
+    parent = comment['parent']
+    fields = (
+        comment['text'],
+        str(comment['author']),
+        str(parent.id if parent else ''),
+    )
+    return hashlib.md5('\x00'.join(fields).encode()).hexdigest()
+
+
+def cache_key(comment, is_owner):
+    return COMMENT_CACHE_KEY.format(
+        id=comment['id'],
+        version=card_version(comment),
+        owner=is_owner,
+    )
+
+
+def render_card(comment, is_owner):
+    parent = comment['parent']
+    return COMMENT_CARD.format(
+        id=comment['id'],
+        author=conditional_escape(comment['author']),
+        text=conditional_escape(comment['text']),
+        parent_id=parent.id if parent else '',
+        delete_link=DELETE_LINK.format(id=comment['id']) if is_owner else '',
+    )
+
+
+def walk(comments_list):
+    """Обходит дерево комментариев в прямом порядке без рекурсии."""
+    stack = [iter(comments_list)]
+    while stack:
+        comment = next(stack[-1], None)
+        if comment is None:
+            stack.pop()
+            continue
+        yield comment
+        if comment.get('children'):
+            stack.append(iter(comment['children']))
+
+
+def render_cards(comments_list, user_id):
+    """Возвращает HTML карточек по id комментария.
+
+    Готовые карточки берутся из кэша одним запросом, недостающие
+    отрисовываются и сохраняются в кэш тоже одним запросом.
+    """
+    keys = {}
+    for comment in walk(comments_list):
+        is_owner = comment['author'].id == user_id
+        keys[cache_key(comment, is_owner)] = (comment, is_owner)
+    cached = cache.get_many(keys)
+    missing = {
+        key: render_card(comment, is_owner)
+        for key, (comment, is_owner) in keys.items()
+        if key not in cached
+    }
+    if missing:
+        cache.set_many(missing, settings.COMMENTS_CACHE_TIMEOUT)
+        cached.update(missing)
+    return {
+        comment['id']: cached[key] for key, (comment, _) in keys.items()
+    }
+
 
 @register.filter
 def comments_filter(comments_list, user_id):
-    print(user_id)
-    res = """
-          <ul style="list-style-type:none;">
-            <div class="col-md-12 mt-2">
-              {}
-            </div>
-          </ul>
-          """
-    i = ''
-    for comment in comments_list:
-        id = comment['id']
-        author = comment['author']
-        if author.id == user_id:
-            i += """
-              <li>
-                <div class="card shadow-lg p-2 mb-2 bg-white rounded">
-                  <div class="card shadow-lg p-2 mb-2 bg-white rounded">
-                    <h5 class="mt-0">{author}</h5>
-                    <hr>
-                    <p>{text}</p>
-                  </div>
-                  <span
-                    class="reply"
-                    data-id="{id}"
-                    data-parent="{parent_id}"
-                    style="color:blue;cursor:pointer;">
-                      <small>Ответить</small>                    
-                      <a href="/posts/{id}/comment_delete/">x</a>                    
-                  </span>
-                  </a>
-                  <form
-                    action=""
-                    method="POST"
-                    class="form-group mb-2"
-                    id="form-{id}"
-                    style="display:none;"
-                  >
-                    <textarea
-                      type="text"
-                      class="form-control"
-                      name="comment-text"
-                      id="{id}"></textarea>
-                    <br>
-                    <input
-                      type="submit"
-                      class="btn btn-primary submit-reply"
-                      data-id="{id}"
-                      data-submit-reply="{parent_id}"
-                      value="Отправить"
-                    >
-                  </form>
-                </div>
-              </li>
-              """.format(
-                      id=comment['id'],
-                      author=comment['author'],
-                      text=comment['text'],
-                      parent_id=comment['parent'],
-                    )
-        else:
-            i += """
-              <li>
-                <div class="card shadow-lg p-2 mb-2 bg-white rounded">
-                  <div class="card shadow-lg p-2 mb-2 bg-white rounded">
-                    <h5 class="mt-0">{author}</h5>
-                    <hr>
-                    <p>{text}</p>
-                  </div>
-                  <span
-                    class="reply"
-                    data-id="{id}"
-                    data-parent="{parent_id}"
-                    style="color:blue;cursor:pointer;">
-                      <small>Ответить</small>                    
-                      
-                  </span>
-                  </a>
-                  <form
-                    action=""
-                    method="POST"
-                    class="form-group mb-2"
-                    id="form-{id}"
-                    style="display:none;"
-                  >
-                    <textarea
-                      type="text"
-                      class="form-control"
-                      name="comment-text"
-                      id="{id}"></textarea>
-                    <br>
-                    <input
-                      type="submit"
-                      class="btn btn-primary submit-reply"
-                      data-id="{id}"
-                      data-submit-reply="{parent_id}"
-                      value="Отправить"
-                    >
-                  </form>
-                </div>
-              </li>
-              """.format(
-                      id=comment['id'],
-                      author=comment['author'],
-                      text=comment['text'],
-                      parent_id=comment['parent'],
-                    )
+    cards = render_cards(comments_list, user_id)
+    parts = [LIST_OPEN]
+    stack = [iter(comments_list)]
+    while stack:
+        comment = next(stack[-1], None)
+        if comment is None:
+            stack.pop()
+            parts.append(LIST_CLOSE)
+            continue
+        parts.append(cards[comment['id']])
         if comment.get('children'):
-            i += comments_filter(comment['children'])
-    
-    return mark_safe(res.format(i))
-    
-
+            parts.append(LIST_OPEN)
+            stack.append(iter(comment['children']))
+    return mark_safe(''.join(parts))
@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from ..holes import make_marker, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    """Фрагмент, зависящий от пользователя.
+
+    На страницах из общего кэша выводится метка, которую заполняет
+    core.holes.fill_holes после чтения кэша, на остальных фрагмент
+    рендерится сразу.
+    """
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        return mark_safe(make_marker(name, args))
+    return render_fragment(request, name, args)
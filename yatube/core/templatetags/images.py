@@ -0,0 +1,144 @@
+import logging
+
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+from sorl.thumbnail import default, get_thumbnail
+
+from ..images import get_variants
+from ..resize import resize_url
+
+register = template.Library()
+
+logger = logging.getLogger(__name__)
+
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+}
+
+
+def variant_url(variant):
+    return variant.get('url') or default.storage.url(variant['name'])
+
+
+def find_variant(variants, geometry):
+    for variant in variants:
+        if variant['geometry'] == geometry:
+            return variant
+    return None
+
+
+def srcset(variants):
+    return ', '.join(
+        f'{variant_url(variant)} {variant["width"]}w'
+        for variant in sorted(variants, key=lambda variant: variant['width'])
+    )
+
+
+def sorl_variant(image, geometry):
+    """Миниатюра через sorl-thumbnail, как это делал тег {% thumbnail %}."""
+    try:
+        thumbnail = get_thumbnail(
+            image, geometry, **settings.THUMBNAIL_OPTIONS
+        )
+    except Exception:
+        # Как и {% thumbnail %}, ошибка миниатюры не ломает страницу.
+        logger.exception('Не удалось получить миниатюру %s', image.name)
+        return None
+    if not thumbnail.size:
+        # Исходный файл недоступен: sorl знает только адрес.
+        return {'url': thumbnail.url}
+    return {
+        'url': thumbnail.url,
+        'width': thumbnail.width,
+        'height': thumbnail.height,
+    }
+
+
+def size_geometry(size):
+    """Геометрия размера из IMAGE_SIZES, геометрия передается как есть."""
+    return settings.IMAGE_SIZES.get(size, size)
+
+
+def lazy_attrs(instance, field_name, lazy):
+    """loading="lazy" и размытая заглушка фоном, пока грузится картинка."""
+    placeholder = getattr(instance, f'{field_name}_placeholder', '')
+    return format_html(
+        '{}{}',
+        mark_safe(' loading="lazy" decoding="async"') if lazy else '',
+        format_html(
+            ' style="background-size:cover;background-image:url({})"',
+            placeholder,
+        ) if placeholder else '',
+    )
+
+
+@register.simple_tag
+def responsive_image(instance, field_name, size, css_class='', lazy=False):
+    """<picture> миниатюры размера size из манифеста вариантов.
+
+    Для каждого формата из THUMBNAIL_SRCSET_FORMATS выводится <source> с
+    srcset по всем ширинам, <img> с width, height и srcset остается в
+    запасном формате THUMBNAIL_FORMAT. Пока манифест не заполнен фоновой
+    генерацией, выводится одна миниатюра sorl-thumbnail. С lazy=True
+    картинка грузится лениво, а до загрузки видна размытая заглушка.
+    """
+    image = getattr(instance, field_name)
+    if not image:
+        return ''
+    geometry = size_geometry(size)
+    by_format = {}
+    for variant in get_variants(instance, field_name):
+        if variant.get('base', variant['geometry']) == geometry:
+            image_format = variant['format'] or settings.THUMBNAIL_FORMAT
+            by_format.setdefault(image_format, []).append(variant)
+    fallback = by_format.pop(settings.THUMBNAIL_FORMAT, [])
+    variant = find_variant(fallback, geometry)
+    if variant is None:
+        variant = sorl_variant(image, geometry)
+        if variant is None:
+            return ''
+        fallback, by_format = [], {}
+    attrs = lazy_attrs(instance, field_name, lazy)
+    if 'width' not in variant:
+        return format_html(
+            '<img class="{}" src="{}"{}>',
+            css_class,
+            variant_url(variant),
+            attrs,
+        )
+    sizes = f'(max-width: {variant["width"]}px) 100vw, {variant["width"]}px'
+    img = format_html(
+        '<img class="{}" src="{}" width="{}" height="{}"{}{}>',
+        css_class,
+        variant_url(variant),
+        variant['width'],
+        variant['height'],
+        format_html(' srcset="{}" sizes="{}"', srcset(fallback), sizes)
+        if len(fallback) > 1 else '',
+        attrs,
+    )
+    if not by_format:
+        return img
+    sources = format_html_join(
+        '',
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[image_format], srcset(by_format[image_format]), sizes)
+            for image_format in settings.THUMBNAIL_SRCSET_FORMATS
+            if image_format in by_format
+        ),
+    )
+    return format_html('<picture>{}{}</picture>', sources, img)
+
+
+@register.simple_tag
+def resized_url(image, size):
+    """Подписанный адрес варианта изображения размера size."""
+    return resize_url(image.name, size_geometry(size)) if image else ''
@@ -0,0 +1,61 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+register = template.Library()
+
+POST_CARD_TEMPLATE = 'posts/includes/post_list.html'
+POST_CARD_CACHE_KEY = 'post_card:{template}:{id}:{version}'
+
+
+def card_version(post):
+    """Отпечаток всего, что выводит карточка поста.
+
+    Правка поста, смена имени автора или группы, а также готовые
+    миниатюры в манифесте изображения дают новый ключ, так что
+    устаревшая карточка просто больше не читается и вытесняется по сроку.
+    """
+    author = post.author
+    group = post.group
+    fields = (
+        post.text,
+        post.image.name,
+        post.image_variants,
+        post.created.isoformat(),
+        author.username,
+        author.first_name,
+        author.last_name,
+        group.slug if group else '',
+    )
+    return hashlib.md5('\x00'.join(fields).encode()).hexdigest()
+
+
+def cache_key(post, template_name):
+    return POST_CARD_CACHE_KEY.format(
+        template=hashlib.md5(template_name.encode()).hexdigest()[:8],
+        id=post.id,
+        version=card_version(post),
+    )
+
+
+@register.simple_tag
+def post_cards(posts, template_name=POST_CARD_TEMPLATE):
+    """Пары (пост, HTML карточки) для списка постов.
+
+    Готовые карточки берутся из кэша одним запросом, недостающие
+    отрисовываются и сохраняются в кэш тоже одним запросом.
+    """
+    keys = [(post, cache_key(post, template_name)) for post in posts]
+    cached = cache.get_many([key for _, key in keys])
+    missing = {
+        key: render_to_string(template_name, {'post': post})
+        for post, key in keys
+        if key not in cached
+    }
+    if missing:
+        cache.set_many(missing, settings.POST_CARDS_CACHE_TIMEOUT)
+        cached.update(missing)
+    return [(post, cached[key]) for post, key in keys]
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import time
+
+from core.cache import SQLiteCache
+from django.test import SimpleTestCase
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_shared_between_instances(self):
+        """Запись видна другому экземпляру, открывшему тот же файл."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.make_cache().get('key'), {'value': 1})
+
+    def test_basic_operations(self):
+        cache = self.cache
+        self.assertIsNone(cache.get('missing'))
+        self.assertTrue(cache.add('key', 1))
+        self.assertFalse(cache.add('key', 2))
+        self.assertEqual(cache.incr('key', 5), 6)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+        cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            cache.get_many(['a', 'b', 'missing']), {'a': 1, 'b': 2}
+        )
+        cache.delete_many(['a', 'key'])
+        self.assertEqual(cache.get_many(['a', 'b', 'key']), {'b': 2})
+        cache.clear()
+        self.assertFalse(cache.has_key('b'))
+
+    def test_expiry(self):
+        cache = self.cache
+        cache.set('key', 'value', 1)
+        cache.set('forever', 'value', None)
+        self.assertEqual(cache.get('key'), 'value')
+        time.sleep(1.1)
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.add('key', 'new'))
+        self.assertEqual(cache.get('forever'), 'value')
+        self.assertTrue(cache.touch('forever', 1))
+        time.sleep(1.1)
+        self.assertFalse(cache.has_key('forever'))
+
+    def test_cull_least_recently_used(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=3,
+            CULL_FREQUENCY=2,
+            ACCESS_RESOLUTION=0,
+            CULL_CHECK_PROBABILITY=1,
+        )
+        for number in range(3):
+            cache.set(f'key{number}', number)
+        cache.get('key0')
+        cache.set('key3', 3)
+        self.assertEqual(
+            sorted(cache.get_many([f'key{n}' for n in range(4)])),
+            ['key0', 'key3'],
+        )
@@ -0,0 +1,25 @@
+from core.holes import fill_holes, make_marker
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+
+class FillHolesTest(SimpleTestCase):
+    def test_headers_kept_and_cached_response_untouched(self):
+        cached = HttpResponse(
+            'Привет, ' + make_marker('username', []),
+            content_type='text/html; charset=utf-8',
+            status=201,
+        )
+        cached['Cache-Control'] = 'private'
+        cached['Vary'] = 'Cookie'
+        cached.set_cookie('theme', 'dark')
+        request = RequestFactory().get('/')
+        request.user = type('User', (), {'username': 'Гость'})()
+        filled = fill_holes(request, cached)
+        filled['X-Filled'] = '1'
+        self.assertEqual(filled.status_code, 201)
+        self.assertEqual(filled['Cache-Control'], 'private')
+        self.assertEqual(filled['Vary'], 'Cookie')
+        self.assertEqual(filled.cookies['theme'].value, 'dark')
+        self.assertContains(filled, 'Привет, Гость', status_code=201)
+        self.assertFalse(cached.has_header('X-Filled'))
@@ -0,0 +1,130 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from core.images import normalize_image
+from core.models import StoredFile
+from core.thumbnails import presets_for, schedule_thumbnails
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from posts.cache import get_versions
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+def make_photo(size, orientation=None, image_format='JPEG', mode='RGB'):
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.new(mode, size, 'red').save(
+        buffer, image_format, exif=exif.tobytes()
+    )
+    buffer.seek(0)
+    return buffer
+
+
+@override_settings(IMAGE_UPLOAD_MAX_SIDE=100)
+class NormalizeImageTest(TestCase):
+    def test_rotated_downscaled_and_stripped(self):
+        content, extension = normalize_image(make_photo((300, 150), 6))
+        self.assertEqual(extension, '.jpg')
+        with Image.open(content) as image:
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(len(image.getexif()), 0)
+
+    def test_clean_image_left_as_is(self):
+        buffer = BytesIO()
+        Image.new('RGB', (80, 40)).save(buffer, 'PNG')
+        self.assertIsNone(normalize_image(buffer))
+
+    def test_transparency_kept_in_png(self):
+        content, extension = normalize_image(
+            make_photo((200, 200), image_format='TIFF', mode='RGBA')
+        )
+        self.assertEqual(extension, '.png')
+        with Image.open(content) as image:
+            self.assertEqual((image.mode, image.size), ('RGBA', (100, 100)))
+
+
+@override_settings(
+    THUMBNAIL_PRESETS={'posts.Post.image': [('800x400', {})]},
+    THUMBNAIL_RESPONSIVE={'posts.Post.image'},
+    THUMBNAIL_SRCSET_SCALES=(0.5, 1, 1.5),
+    THUMBNAIL_SRCSET_FORMATS=('JPEG',),
+)
+class PresetsTest(SimpleTestCase):
+    def geometries(self, image_width):
+        return [
+            geometry for geometry, base, options
+            in presets_for(Post(image_width=image_width), 'image')
+        ]
+
+    def test_srcset_variants_not_upscaled(self):
+        self.assertEqual(self.geometries(1000), ['800x400', '400x200'])
+        self.assertEqual(self.geometries(300), ['800x400'])
+        self.assertEqual(
+            self.geometries(1200), ['800x400', '400x200', '1200x600']
+        )
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    IMAGE_UPLOAD_MAX_SIDE=100,
+    THUMBNAIL_WORKERS=0,
+)
+class NormalizeUploadTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_original_replaced_before_thumbnails(self):
+        post = Post.objects.create(
+            text='Фото',
+            author=User.objects.create_user(username='auth'),
+            image=SimpleUploadedFile(
+                'photo.jpeg', make_photo((300, 150), 6).getvalue()
+            ),
+        )
+        original = post.image.name
+        versions = get_versions(['index', 'author:auth'])
+        schedule_thumbnails(post, 'image')
+        post.refresh_from_db()
+        # Страницы, закэшированные со ссылкой на исходник, устарели.
+        self.assertNotEqual(get_versions(['index', 'author:auth']), versions)
+        self.assertNotEqual(post.image.name, original)
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        self.assertEqual((post.image_width, post.image_height), (50, 100))
+        self.assertTrue(post.image_variants)
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).references, 1
+        )
+
+    def test_process_images_fills_missing_metadata(self):
+        """Метаданные старых загрузок заполняет команда, а не миграция."""
+        post = Post.objects.create(
+            text='Старое фото',
+            author=User.objects.create_user(username='old'),
+            image=SimpleUploadedFile(
+                'old.jpg', make_photo((80, 40)).getvalue()
+            ),
+        )
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_format='',
+            image_bytes=None,
+        )
+        call_command('process_images', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format),
+            (80, 40, 'JPEG'),
+        )
+        self.assertEqual(post.image_bytes, post.image.size)
@@ -0,0 +1,35 @@
+from core.kvstore import LRUKVStore
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from sorl.thumbnail.images import ImageFile
+
+
+@override_settings(THUMBNAIL_LRU_CHECK_INTERVAL=0)
+class LRUKVStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = LRUKVStore()
+        self.image = ImageFile('cache/test.jpg')
+        self.image.set_size((80, 40))
+
+    def test_repeat_lookups_served_from_memory(self):
+        self.store.set(self.image)
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                self.assertEqual(self.store.get(self.image).size, [80, 40])
+        self.assertEqual(self.store.stats()['hits'], 3)
+
+    def test_delete_in_other_worker_invalidates(self):
+        """Удаление в другом процессе сбрасывает LRU этого процесса."""
+        self.store.set(self.image)
+        self.store.get(self.image)
+        LRUKVStore().delete(self.image, delete_thumbnails=False)
+        self.assertIsNone(self.store.get(self.image))
+
+    @override_settings(THUMBNAIL_LRU_SIZE=1)
+    def test_size_is_bounded(self):
+        other = ImageFile('cache/other.jpg')
+        other.set_size((10, 10))
+        self.store.set(self.image)
+        self.store.set(other)
+        self.assertEqual(self.store.stats()['size'], 1)
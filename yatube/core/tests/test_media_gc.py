@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from core.images import get_variants
+from core.media_gc import MediaCollector
+from core.thumbnails import presets_for, process_image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from posts.models import Post
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+def make_image(name, color):
+    buffer = BytesIO()
+    Image.new('RGB', (40, 20), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    THUMBNAIL_PRESETS={'posts.Post.image': [('20x10', {})]},
+    THUMBNAIL_RESPONSIVE=set(),
+)
+class MediaCollectorTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, color):
+        post = Post.objects.create(
+            text=color,
+            author=self.user,
+            image=make_image(f'{color}.jpg', color),
+        )
+        process_image(post, 'image', presets_for(post, 'image'))
+        return post
+
+    def write(self, name):
+        path = os.path.join(TEMP_MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'x' * 10)
+        return path
+
+    def setUp(self):
+        # Записи KV в кэше переживают откат базы между тестами.
+        cache.clear()
+        default.kvstore.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.kept = self.create_post('red')
+        deleted = self.create_post('blue')
+        self.deleted_image = deleted.image.name
+        # Удаление в обход сигналов, как у постов до появления счетчиков.
+        Post.objects.filter(pk=deleted.pk).update(image='')
+        self.orphans = [
+            self.write('posts/legacy.jpg'),
+            self.write('cache/00/00/unknown.jpg'),
+            self.write('resize/ab/abcd/10x10/posts/legacy.jpg'),
+        ]
+
+    def media_files(self):
+        return {
+            os.path.relpath(os.path.join(directory, name), TEMP_MEDIA_ROOT)
+            for directory, _, names in os.walk(TEMP_MEDIA_ROOT)
+            for name in names
+        }
+
+    def test_dry_run_reports_reclaimable_bytes(self):
+        before = self.media_files()
+        report = MediaCollector(min_age=0, dry_run=True).collect()
+        self.assertEqual(self.media_files(), before)
+        self.assertEqual(report['originals']['files'], 2)
+        self.assertEqual(report['thumbnails']['files'], 2)
+        self.assertEqual(report['resized']['bytes'], 10)
+        self.assertEqual(report['kvstore']['entries'], 3)
+
+    def test_unreferenced_files_removed(self):
+        kept_thumbnails = {
+            variant['name'] for variant in get_variants(self.kept, 'image')
+        }
+        MediaCollector(min_age=0, batch_size=2).collect()
+        files = self.media_files()
+        self.assertIn(self.kept.image.name, files)
+        self.assertTrue(kept_thumbnails <= files)
+        self.assertNotIn(self.deleted_image, files)
+        for path in self.orphans:
+            self.assertFalse(os.path.exists(path))
+        self.assertIsNone(default.kvstore.get(
+            ImageFile(self.deleted_image, self.kept.image.storage)
+        ))
+        self.assertIsNotNone(default.kvstore.get(ImageFile(self.kept.image)))
+
+    def test_recent_files_kept(self):
+        MediaCollector(min_age=3600).collect()
+        for path in self.orphans:
+            self.assertTrue(os.path.exists(path))
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from core import resize
+from django.conf import settings
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ResizeViewTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        Image.new('RGB', (120, 80), 'red').save(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'red.jpg')
+        )
+        with open(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'bad.jpg'), 'wb'
+        ) as file:
+            file.write(b'\xff\xd8 not a jpeg')
+        # Снимок камеры телефона: JPEG с несколькими кадрами (MPO).
+        Image.new('RGB', (120, 80), 'red').save(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'phone.jpg'),
+            'MPO',
+            save_all=True,
+            append_images=[Image.new('RGB', (120, 80), 'blue')],
+        )
+        # Pillow читает XPM, но писать его не умеет.
+        with open(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'icon.xpm'), 'w'
+        ) as file:
+            file.write(
+                '/* XPM */\nstatic char *icon[] = {\n"2 2 1 1",\n'
+                '"a c #FF0000",\n"aa",\n"aa"\n};\n'
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(
+            os.path.join(TEMP_MEDIA_ROOT, settings.RESIZE_CACHE_DIR),
+            ignore_errors=True,
+        )
+
+    def test_resize_on_first_request(self):
+        url = resize.resize_url('posts/red.jpg', '40x40')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        signature = resize.sign('40x40', 'posts/red.jpg')
+        path = resize.cache_path(signature, '40x40', 'posts/red.jpg')
+        self.assertIn(os.path.join(signature[:2], signature), path)
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (40, 40))
+
+    def test_output_format_chosen_by_extension(self):
+        """Исходники в форматах, которые Pillow не умеет писать, дают
+        JPEG или PNG, а не 500."""
+        for name, image_format in (
+            ('posts/phone.jpg', 'JPEG'),
+            ('posts/icon.xpm', 'PNG'),
+        ):
+            with self.subTest(name=name):
+                response = self.client.get(resize.resize_url(name, '40x40'))
+                self.assertEqual(response.status_code, 200)
+                path = resize.cache_path(
+                    resize.sign('40x40', name), '40x40', name
+                )
+                with Image.open(path) as image:
+                    self.assertEqual(
+                        (image.format, image.size), (image_format, (40, 40))
+                    )
+
+    def test_unsigned_geometry_rejected(self):
+        url = resize.resize_url('posts/red.jpg', '40x40')
+        for bad_url in (
+            url.replace('40x40', '41x41'),
+            url.replace(resize.sign('40x40', 'posts/red.jpg'), '0' * 16),
+        ):
+            with self.subTest(url=bad_url):
+                self.assertEqual(self.client.get(bad_url).status_code, 403)
+
+    def test_broken_source_not_found(self):
+        """Поврежденный или слишком большой исходник дает 404, а не 500."""
+        self.assertEqual(
+            self.client.get(
+                resize.resize_url('posts/bad.jpg', '40x40')
+            ).status_code,
+            404,
+        )
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 10):
+            response = self.client.get(
+                resize.resize_url('posts/red.jpg', '40x40')
+            )
+        self.assertEqual(response.status_code, 404)
+
+    def test_template_uses_size_names(self):
+        image = SimpleNamespace(name='posts/red.jpg')
+        html = Template(
+            '{% load images %}{% resized_url image "avatar" %}'
+        ).render(Context({'image': image}))
+        self.assertEqual(
+            html,
+            resize.resize_url('posts/red.jpg', settings.IMAGE_SIZES['avatar']),
+        )
+
+    def test_concurrent_requests_resize_once(self):
+        signature = resize.sign('60x30', 'posts/red.jpg')
+        barrier = threading.Barrier(4)
+
+        def request():
+            barrier.wait()
+            resize.get_resized(signature, '60x30', 'posts/red.jpg')
+
+        with mock.patch.object(
+            resize, 'resize', wraps=resize.resize
+        ) as patched:
+            threads = [threading.Thread(target=request) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(patched.call_count, 1)
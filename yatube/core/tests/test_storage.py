@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from posts.models import Post
+from sorl.thumbnail import default, get_thumbnail
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+
+def make_gif(name, color):
+    buffer = BytesIO()
+    Image.new('RGB', (2, 1), color).save(buffer, 'GIF')
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.storage = ContentAddressedStorage()
+
+    def test_identical_uploads_stored_once(self):
+        first = self.storage.save('posts/a.JPG', ContentFile(b'image'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('posts/a.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        directory, shard, subshard, filename = first.split('/')
+        self.assertEqual(directory, 'posts')
+        self.assertEqual(shard + subshard, filename[:4])
+        self.assertTrue(filename.endswith('.jpg'))
+        stored = StoredFile.objects.get(name=first)
+        self.assertEqual((stored.references, stored.size), (2, 5))
+        self.assertEqual(
+            [name for name in os.listdir(TEMP_MEDIA_ROOT)
+             if name.startswith('.')],
+            [],
+        )
+
+    def test_file_deleted_with_last_reference(self):
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        self.storage.release(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.release(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_thumbnails_not_renamed(self):
+        """Миниатюра находится по своему имени и не создается заново."""
+        cache.clear()
+        default.kvstore.clear()
+        post = Post.objects.create(
+            text='Пост',
+            author=User.objects.create_user(username='auth'),
+            image=make_gif('a.gif', 'red'),
+        )
+        with mock.patch.object(
+            default.backend, '_create_thumbnail',
+            wraps=default.backend._create_thumbnail,
+        ) as create:
+            first = get_thumbnail(post.image, '40x20')
+            second = get_thumbnail(post.image, '40x20')
+        create.assert_called_once()
+        self.assertEqual(first.name, second.name)
+        self.assertTrue(default.storage.exists(first.name))
+        self.assertFalse(
+            StoredFile.objects.filter(name__startswith='cache/').exists()
+        )
+
+    def test_untracked_file_not_deleted(self):
+        path = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'legacy.jpg')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(b'image')
+        self.storage.release('posts/legacy.jpg')
+        self.assertTrue(os.path.exists(path))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ImageReferencesTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_references_follow_posts(self):
+        """Ссылки снимаются при удалении поста и замене изображения."""
+        user = User.objects.create_user(username='auth')
+        posts = [
+            Post.objects.create(
+                text=f'Пост {index}',
+                author=user,
+                image=make_gif('same.gif', 'red'),
+            )
+            for index in range(2)
+        ]
+        name = posts[0].image.name
+        self.assertEqual(posts[1].image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        posts[0].delete()
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        posts[1].image = make_gif('new.gif', 'blue')
+        posts[1].save()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name)))
@@ -0,0 +1,200 @@
+import logging
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+
+from .images import (get_variants, has_placeholder, make_placeholder,
+                     normalize_upload, save_image_fields)
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+# Одинаковые загрузки хранятся одним файлом (core.storage), и задачи для
+# него не должны создавать одни и те же миниатюры параллельно.
+_image_locks = [threading.Lock() for _ in range(64)]
+
+FORMAT_EXTENSIONS = dict(EXTENSIONS, AVIF='avif')
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl, который знает расширение файлов AVIF."""
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = f'{key[:2]}/{key[2:4]}/{key}'
+        extension = FORMAT_EXTENSIONS[options['format']]
+        return f'{thumbnail_settings.THUMBNAIL_PREFIX}{path}.{extension}'
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def supported_formats():
+    """Форматы из THUMBNAIL_SRCSET_FORMATS, которые умеет писать Pillow."""
+    Image.init()
+    return [
+        image_format for image_format in settings.THUMBNAIL_SRCSET_FORMATS
+        if image_format in Image.SAVE and image_format in FORMAT_EXTENSIONS
+    ]
+
+
+def scale_geometry(geometry, scale):
+    width, height = (int(side) for side in geometry.split('x'))
+    return f'{round(width * scale)}x{round(height * scale)}'
+
+
+def presets_for(instance, field_name):
+    """Пресеты поля: (геометрия, базовая геометрия, параметры).
+
+    Для полей из THUMBNAIL_RESPONSIVE каждый пресет дополняется
+    вариантами ширины THUMBNAIL_SRCSET_SCALES во всех поддерживаемых
+    форматах, JPEG по умолчанию остается запасным вариантом. Варианты
+    шире исходного изображения пропускаются: растянутая копия не четче
+    базовой, а весит больше.
+    """
+    label = f'{instance._meta.label}.{field_name}'
+    image_width = getattr(instance, f'{field_name}_width', None)
+    presets = []
+    for geometry, options in settings.THUMBNAIL_PRESETS.get(label, ()):
+        presets.append((geometry, geometry, options))
+        if label not in settings.THUMBNAIL_RESPONSIVE:
+            continue
+        for scale in settings.THUMBNAIL_SRCSET_SCALES:
+            scaled = scale_geometry(geometry, scale)
+            if (
+                scale != 1 and image_width
+                and int(scaled.split('x')[0]) > image_width
+            ):
+                continue
+            for image_format in supported_formats():
+                if scale == 1 and image_format == settings.THUMBNAIL_FORMAT:
+                    continue
+                presets.append((
+                    scaled, geometry, dict(options, format=image_format)
+                ))
+    return presets
+
+
+def generate_thumbnails(image, presets):
+    """Создает миниатюры и записывает их в KV-хранилище sorl.
+
+    Параметры пресетов совпадают с тегами {% thumbnail %} в шаблонах,
+    поэтому при рендере миниатюра находится в KV-хранилище и исходное
+    изображение не декодируется. Возвращает манифест созданных
+    вариантов для core.images.save_image_fields.
+    """
+    variants = []
+    for geometry, base, options in presets:
+        try:
+            thumbnail = get_thumbnail(image, geometry, **options)
+        except Exception:
+            logger.exception(
+                'Не удалось создать миниатюру %s для %s', geometry, image.name
+            )
+            continue
+        variants.append({
+            'name': thumbnail.name,
+            'geometry': geometry,
+            'base': base,
+            'width': thumbnail.width,
+            'height': thumbnail.height,
+            'format': options.get('format', settings.THUMBNAIL_FORMAT),
+        })
+    return variants
+
+
+def image_lock(name):
+    return _image_locks[zlib.crc32(name.encode()) % len(_image_locks)]
+
+
+def find_processed(instance, field_name):
+    """Другой объект с тем же файлом, для которого варианты уже созданы."""
+    return type(instance)._default_manager.filter(
+        **{field_name: getattr(instance, field_name).name}
+    ).exclude(pk=instance.pk).exclude(
+        **{f'{field_name}_variants': ''}
+    ).first()
+
+
+def process_image(instance, field_name, presets=None, reuse=True):
+    """Нормализует загрузку, создает миниатюры, манифест и заглушку.
+
+    Без presets пресеты берутся из presets_for уже после нормализации,
+    когда известна итоговая ширина изображения. С reuse=True повторная
+    загрузка того же файла берет манифест и заглушку у уже обработанного
+    объекта и ничего не декодирует.
+    """
+    if not normalize_upload(instance, field_name):
+        return
+    if presets is None:
+        presets = presets_for(instance, field_name)
+    image = getattr(instance, field_name)
+    with image_lock(image.name):
+        processed = find_processed(instance, field_name) if reuse else None
+        if processed is not None:
+            save_image_fields(
+                instance,
+                field_name,
+                get_variants(processed, field_name),
+                getattr(processed, f'{field_name}_placeholder', None),
+            )
+            return
+        _process_image(instance, field_name, presets)
+
+
+def _process_image(instance, field_name, presets):
+    image = getattr(instance, field_name)
+    placeholder = None
+    if has_placeholder(instance, field_name):
+        try:
+            with image.open('rb'):
+                placeholder = make_placeholder(image)
+        except (OSError, ValueError):
+            logger.exception('Не удалось создать заглушку для %s', image.name)
+    save_image_fields(
+        instance,
+        field_name,
+        generate_thumbnails(image, presets),
+        placeholder,
+    )
+
+
+def _process_in_worker(instance, field_name):
+    try:
+        process_image(instance, field_name)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnails(instance, field_name):
+    """Ставит миниатюры поля field_name в очередь пула после коммита.
+
+    При THUMBNAIL_WORKERS = 0 миниатюры создаются сразу в текущем потоке.
+    """
+    if not getattr(instance, field_name):
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        process_image(instance, field_name)
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(
+            _process_in_worker, instance, field_name
+        )
+    )
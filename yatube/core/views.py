@@ -1,4 +1,10 @@
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
+from PIL import Image
+
+from .resize import get_resized, is_valid
 
 
 def page_not_found(request, exception):
@@ -15,3 +21,21 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@require_safe
+def resize_image(request, signature, geometry, name):
+    """Вариант изображения из дискового кэша, созданный при первом запросе.
+
+    Дальше тот же файл отдает nginx, и запрос сюда не доходит.
+    """
+    if not is_valid(signature, geometry, name):
+        raise PermissionDenied
+    try:
+        path = get_resized(signature, geometry, name)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Нет исходника, либо он поврежден или слишком велик для Pillow.
+        raise Http404
+    response = FileResponse(open(path, 'rb'))
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,145 @@
+import hashlib
+import math
+import random
+import time
+from functools import wraps
+
+from core.holes import fill_holes, punch_holes
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+PAGE_KEY = 'page:{path}'
+LOCK_KEY = 'lock:{}'
+
+
+def new_version():
+    """Начальная версия области.
+
+    Берется от текущего времени, чтобы после вытеснения счетчика из кэша
+    версия не вернулась к значению, под которым уже лежат старые страницы.
+    """
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(scopes):
+    """Делает устаревшими все страницы, закэшированные для scopes."""
+    for scope in set(scopes):
+        key = VERSION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+
+
+def expires_early(entry, now, beta=1.0):
+    """Вероятностный досрочный пересчет (XFetch).
+
+    Чем ближе срок записи и чем дольше она считалась, тем вероятнее, что
+    очередной запрос пересчитает ее заранее. Так записи, которые читают
+    часто, обновляются до истечения срока по одной, а не все сразу.
+    """
+    return now - entry['delta'] * beta * math.log(random.random()) >= (
+        entry['expires']
+    )
+
+
+def wait_for_entry(key, tag):
+    deadline = time.time() + settings.CACHE_LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(settings.CACHE_LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and entry['tag'] == tag:
+            return entry
+    return None
+
+
+def get_or_recompute(key, compute, timeout, tag=None,
+                     cacheable=lambda value: True):
+    """Значение из кэша с защитой от одновременного пересчета.
+
+    Запись хранится вместе с tag (например, версиями областей) и дольше
+    своего срока на CACHE_STALE_TIMEOUT. Если запись устарела, пересчитать
+    ее берется только запрос, захвативший блокировку; остальные в это
+    время отдают старую копию, а при ее отсутствии ждут результата и,
+    не дождавшись, считают значение только для себя.
+    """
+    entry = cache.get(key)
+    if (
+        entry is not None
+        and entry['tag'] == tag
+        and not expires_early(entry, time.time())
+    ):
+        return entry['value']
+    lock = LOCK_KEY.format(key)
+    if not cache.add(lock, True, settings.CACHE_LOCK_TIMEOUT):
+        if entry is None:
+            entry = wait_for_entry(key, tag)
+        if entry is not None:
+            return entry['value']
+        # Не дождались: считаем для себя, но запись и чужую блокировку
+        # не трогаем.
+        return compute()
+    try:
+        start = time.time()
+        value = compute()
+        finished = time.time()
+        if cacheable(value):
+            cache.set(
+                key,
+                {
+                    'tag': tag,
+                    'value': value,
+                    'delta': finished - start,
+                    'expires': finished + timeout,
+                },
+                timeout + settings.CACHE_STALE_TIMEOUT,
+            )
+    finally:
+        cache.delete(lock)
+    return value
+
+
+def page_cache_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(path=path)
+
+
+def cache_page_versioned(get_scopes, timeout=None):
+    """Кэширует страницу, пока не изменились версии ее областей.
+
+    get_scopes получает аргументы представления и возвращает области,
+    от которых зависит страница ('index', 'group:<slug>',
+    'author:<username>'). Сигналы моделей повышают версии областей, так
+    что страница может храниться долго и не устаревать. Пересчет
+    страницы защищен от лавины запросов через get_or_recompute.
+
+    Страница рендерится без данных пользователя и хранится одна на всех:
+    фрагменты из тегов {% hole %} подставляются уже после чтения кэша.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            punch_holes(request)
+            response = get_or_recompute(
+                page_cache_key(request),
+                lambda: view(request, *args, **kwargs),
+                timeout or settings.POSTS_PAGE_CACHE_TIMEOUT,
+                tag=get_versions(get_scopes(*args, **kwargs)),
+                cacheable=lambda response: response.status_code == 200,
+            )
+            return fill_holes(request, response)
+        return wrapper
+    return decorator
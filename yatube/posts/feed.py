@@ -0,0 +1,243 @@
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice, product
+
+from django.conf import settings
+from django.db import connections, transaction
+from users.models import Profile
+
+from .models import FeedEntry, Follow, Post
+
+BATCH_SIZE = 1000
+
+PULL = 'pull'
+PUSH = 'push'
+HYBRID = 'hybrid'
+
+
+def bulk_insert(entries):
+    """Вставляет записи ленты пачками, не собирая их все в память."""
+    entries = iter(entries)
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+def followers_count(author_id):
+    return Profile.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True
+    ).first() or 0
+
+
+def is_pulled(author_id):
+    """Посты автора не рассылаются, а подмешиваются при чтении ленты.
+
+    Так устроена гибридная лента для авторов, у которых подписчиков
+    не меньше FEED_FANOUT_THRESHOLD.
+    """
+    if settings.FEED_MODE != HYBRID:
+        return False
+    return followers_count(author_id) >= settings.FEED_FANOUT_THRESHOLD
+
+
+def fan_out_post(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    bulk_insert(
+        FeedEntry(
+            user_id=user_id,
+            post=post,
+            author_id=post.author_id,
+            created=post.created,
+        )
+        for user_id in followers.iterator()
+    )
+
+
+def backfill_feed(user_id, author_id):
+    """Переносит в ленту пользователя посты автора после подписки."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'created')
+    bulk_insert(
+        FeedEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            created=created,
+        )
+        for post_id, created in posts.iterator()
+    )
+
+
+def backfill_followers(author_id):
+    """Переносит посты автора в ленты всех его подписчиков.
+
+    Посты читаются один раз, подписчики - пачками по BATCH_SIZE, записи
+    вставляются пачками, так что число запросов не зависит от числа
+    подписчиков, умноженного на число постов.
+    """
+    if is_pulled(author_id):
+        return
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'created'))
+    if not posts:
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator()
+    batch = list(islice(followers, BATCH_SIZE))
+    while batch:
+        bulk_insert(
+            FeedEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                created=created,
+            )
+            for user_id, (post_id, created) in product(batch, posts)
+        )
+        batch = list(islice(followers, BATCH_SIZE))
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.FEED_WORKERS,
+        thread_name_prefix='feed',
+    )
+
+
+def _backfill_in_worker(author_id):
+    try:
+        backfill_followers(author_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_backfill(author_id):
+    """Ставит дозаполнение лент подписчиков в очередь после коммита.
+
+    При FEED_WORKERS = 0 ленты дозаполняются после коммита в текущем
+    потоке.
+    """
+    if not settings.FEED_WORKERS:
+        transaction.on_commit(lambda: backfill_followers(author_id))
+        return
+    transaction.on_commit(
+        lambda: get_executor().submit(_backfill_in_worker, author_id)
+    )
+
+
+def prune_feed(user_id, author_id, was_pulled=False):
+    """Убирает из ленты пользователя посты автора после отписки.
+
+    Если автор, посты которого до отписки подмешивались при чтении
+    (was_pulled), опустился ниже порога гибридной ленты, его посты снова
+    рассылаются подписчикам, и ленты дозаполняются в фоне, а не в запросе
+    отписки. Сравниваются состояния до и после, поэтому счетчик может
+    перескочить через порог сразу на несколько подписчиков.
+    """
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    if was_pulled and not is_pulled(author_id):
+        schedule_backfill(author_id)
+
+
+class MergedFeed:
+    """Ленивое слияние нескольких лент, упорядоченных по -created.
+
+    Для среза [start:stop] из каждого источника читается не больше stop
+    постов, после чего источники сливаются k-way слиянием через heapq.
+    Объект совместим с django.core.paginator.Paginator, а filter и
+    order_by применяются к каждому источнику, что позволяет листать
+    ленту и через CursorPaginator.
+    """
+
+    def __init__(self, sources, descending=True):
+        self.sources = sources
+        self.descending = descending
+
+    def filter(self, *args, **kwargs):
+        return MergedFeed(
+            [source.filter(*args, **kwargs) for source in self.sources],
+            self.descending,
+        )
+
+    def order_by(self, *fields):
+        return MergedFeed(
+            [source.order_by(*fields) for source in self.sources],
+            fields[0].startswith('-'),
+        )
+
+    def count(self):
+        return sum(source.count() for source in self.sources)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop
+        streams = [
+            source if stop is None else source[:stop]
+            for source in self.sources
+        ]
+        merged = heapq.merge(
+            *streams,
+            key=lambda post: (post.created, post.pk),
+            reverse=self.descending,
+        )
+        return list(islice(merged, start, stop))
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, чьи посты читаются напрямую."""
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__profile__followers_count__gte=(
+                settings.FEED_FANOUT_THRESHOLD
+            ),
+        ).values_list('author_id', flat=True)
+    )
+
+
+def get_feed(user, mode=None):
+    """Посты ленты подписок в порядке публикации.
+
+    pull читает посты авторов через Follow, push - материализованную
+    ленту читателя, hybrid - материализованную ленту вместе с постами
+    популярных авторов, которые подмешиваются при чтении.
+    """
+    mode = mode or settings.FEED_MODE
+    if mode == PULL:
+        return Post.objects.filter(
+            author__following__user=user
+        ).select_related('author', 'group')
+    pushed = Post.objects.filter(
+        feed_entries__user=user
+    ).select_related('author', 'group').order_by('-feed_entries__created')
+    if mode != HYBRID:
+        return pushed
+    authors = pulled_authors(user)
+    if not authors:
+        return pushed
+    # Все популярные авторы читаются одним источником по author_id__in,
+    # чтобы число запросов не росло с их числом.
+    return MergedFeed([
+        pushed.exclude(author_id__in=authors),
+        Post.objects.filter(author_id__in=authors)
+        .select_related('author', 'group')
+        .order_by('-created', '-pk'),
+    ])
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Follow
+
+FOLLOWING_CACHE_KEY = 'following:{}'
+
+
+def get_following_ids(user):
+    """Множество id авторов, на которых подписан пользователь.
+
+    Множество читается одним запросом и кэшируется до следующей
+    подписки или отписки пользователя.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    key = FOLLOWING_CACHE_KEY.format(user.pk)
+    following_ids = cache.get(key)
+    if following_ids is None:
+        following_ids = frozenset(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+        cache.set(key, following_ids, settings.FOLLOWING_CACHE_TIMEOUT)
+    return following_ids
+
+
+def followed_authors(user, authors):
+    """Отвечает, на кого из authors подписан пользователь.
+
+    Возвращает множество id подписанных авторов; authors может содержать
+    как пользователей, так и их id.
+    """
+    following_ids = get_following_ids(user)
+    return {
+        author_id
+        for author_id in (getattr(author, 'pk', author) for author in authors)
+        if author_id in following_ids
+    }
+
+
+def invalidate_following(user_id):
+    cache.delete(FOLLOWING_CACHE_KEY.format(user_id))
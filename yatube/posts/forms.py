@@ -1,4 +1,6 @@
+from core.images import validate_upload
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
 from .models import Comment, Post
 
@@ -9,6 +11,12 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            validate_upload(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
 
@@ -0,0 +1,39 @@
+from core.holes import fragment
+
+from .follows import get_following_ids
+
+
+def following_ids(request):
+    """Подписки пользователя, прочитанные один раз на запрос: кнопки
+    подписки у всех карточек страницы обходятся одним чтением кэша."""
+    if not hasattr(request, 'following_ids'):
+        request.following_ids = get_following_ids(request.user)
+    return request.following_ids
+
+
+@fragment('aside', 'posts/includes/aside.html')
+def aside(request):
+    return {}
+
+
+@fragment('switcher', 'posts/includes/switcher.html')
+def switcher(request):
+    return {}
+
+
+@fragment('profile_actions', 'users/includes/profile_actions.html')
+def profile_actions(request, author_id, username):
+    return {
+        'author_id': int(author_id),
+        'username': username,
+        'following': int(author_id) in following_ids(request),
+    }
+
+
+@fragment('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, author_id, username):
+    return {
+        'author_id': int(author_id),
+        'username': username,
+        'following': int(author_id) in following_ids(request),
+    }
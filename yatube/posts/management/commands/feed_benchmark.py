@@ -0,0 +1,138 @@
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from posts.feed import HYBRID, PULL, PUSH, backfill_feed, get_feed
+from posts.models import Follow, Post, User
+from users.models import Profile
+
+MODES = (PULL, PUSH, HYBRID)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает ленты pull, push и hybrid на синтетическом графе '
+        'подписок. Все данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=300)
+        parser.add_argument('--authors', type=int, default=100)
+        parser.add_argument('--celebrities', type=int, default=5)
+        parser.add_argument('--follows', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=20)
+        parser.add_argument('--samples', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        readers, authors, celebrities = self.build_graph(options)
+        threshold = len(readers)
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        samples = random.sample(
+            readers, min(options['samples'], len(readers))
+        )
+
+        self.stdout.write(
+            f'readers={len(readers)} authors={len(authors)} '
+            f'celebrities={len(celebrities)} '
+            f'follows/reader={options["follows"]} '
+            f'posts/author={options["posts"]} threshold={threshold}'
+        )
+        self.stdout.write(
+            f'{"mode":<8}{"page 1, ms":>12}{"page 5, ms":>12}'
+            f'{"queries":>10}{"publish, ms":>14}'
+        )
+        for mode in MODES:
+            with override_settings(
+                FEED_MODE=mode, FEED_FANOUT_THRESHOLD=threshold
+            ):
+                first, queries = self.measure_read(samples, page_size, 1)
+                deep, _ = self.measure_read(samples, page_size, 5)
+                publish = self.measure_publish(celebrities)
+            self.stdout.write(
+                f'{mode:<8}{first:>12.2f}{deep:>12.2f}'
+                f'{queries:>10.1f}{publish:>14.2f}'
+            )
+
+    def build_graph(self, options):
+        prefix = f'feedbench{random.randint(0, 10 ** 9)}'
+        User.objects.bulk_create(
+            User(username=f'{prefix}_{i}')
+            for i in range(options['readers'] + options['authors'])
+        )
+        users = list(
+            User.objects.filter(username__startswith=prefix).order_by('pk')
+        )
+        readers = users[:options['readers']]
+        authors = users[options['readers']:]
+        celebrities = authors[:options['celebrities']]
+        regular = authors[options['celebrities']:]
+
+        Post.objects.bulk_create(
+            Post(author=author, title='', text=f'post {i} of {author.pk}')
+            for author in authors
+            for i in range(options['posts'])
+        )
+        follows = []
+        for reader in readers:
+            followed = random.sample(
+                regular, min(options['follows'], len(regular))
+            )
+            follows.extend(
+                Follow(user=reader, author=author)
+                for author in celebrities + followed
+            )
+        Follow.objects.bulk_create(follows)
+        followers = Counter(follow.author.pk for follow in follows)
+        following = Counter(follow.user.pk for follow in follows)
+        Profile.objects.bulk_create(
+            Profile(
+                user=user,
+                followers_count=followers[user.pk],
+                following_count=following[user.pk],
+            )
+            for user in users
+        )
+        with override_settings(FEED_MODE=PUSH):
+            for follow in follows:
+                backfill_feed(follow.user.pk, follow.author.pk)
+        return readers, authors, celebrities
+
+    def measure_read(self, readers, page_size, page_number):
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            for reader in readers:
+                page = Paginator(get_feed(reader), page_size).get_page(
+                    page_number
+                )
+                list(page)
+        elapsed = time.perf_counter() - started
+        return (
+            elapsed * 1000 / len(readers),
+            len(queries.captured_queries) / len(readers),
+        )
+
+    def measure_publish(self, celebrities):
+        started = time.perf_counter()
+        for author in celebrities:
+            Post.objects.create(author=author, title='', text='benchmark')
+        elapsed = time.perf_counter() - started
+        return elapsed * 1000 / len(celebrities)
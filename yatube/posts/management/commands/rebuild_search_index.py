@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from posts.models import Post
+from posts.search import get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        'Переиндексирует посты для полнотекстового поиска пачками по id и '
+        'удаляет из индекса записи удаленных постов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Сколько постов индексировать в одной транзакции.',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        chunk_size = options['chunk_size']
+        posts = Post.objects.only('id', 'title', 'text').order_by('pk')
+        last_pk = 0
+        indexed = 0
+        while True:
+            chunk = list(posts.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                backend.index(chunk)
+            last_pk = chunk[-1].pk
+            indexed += len(chunk)
+            self.stdout.write(f'Проиндексировано постов: {indexed}')
+        with transaction.atomic():
+            backend.prune()
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:43
+
+from itertools import islice
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+BATCH_SIZE = 1000
+
+
+def fill_comment_paths(apps, schema_editor):
+    """Заполняет пути пачками, держа в памяти только текущую пачку.
+
+    Родитель всегда создан раньше ответа, поэтому при обходе по id путь
+    родителя уже записан: в базу предыдущими пачками или в эту пачку.
+    """
+    Comment = apps.get_model('posts', 'Comment')
+    comments = Comment.objects.order_by('id').iterator()
+    batch = list(islice(comments, BATCH_SIZE))
+    while batch:
+        ids = {comment.id for comment in batch}
+        paths = dict(Comment.objects.filter(pk__in={
+            comment.parent_id for comment in batch
+            if comment.parent_id is not None
+            and comment.parent_id not in ids
+        }).values_list('id', 'path'))
+        for comment in batch:
+            parent_path = paths.get(comment.parent_id, '')
+            comment.path = parent_path + str(comment.id).zfill(PATH_STEP)
+            comment.is_child = comment.parent_id is not None
+            paths[comment.id] = comment.path
+        Comment.objects.bulk_update(batch, ['path', 'is_child'])
+        batch = list(islice(comments, BATCH_SIZE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_title'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве комментариев'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['object_id', 'path'], name='comment_thread_path_idx'),
+        ),
+        migrations.RunPython(fill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-18 23:50
+
+from django.db import migrations
+
+CREATE_SQL = {
+    'postgresql': [
+        'CREATE TABLE posts_search ('
+        'post_id integer PRIMARY KEY '
+        'REFERENCES posts_post (id) ON DELETE CASCADE '
+        'DEFERRABLE INITIALLY DEFERRED, '
+        'document tsvector NOT NULL)',
+        'CREATE INDEX posts_search_document_idx '
+        'ON posts_search USING GIN (document)',
+    ],
+    'sqlite': [
+        'CREATE VIRTUAL TABLE posts_search USING fts5('
+        'title, text, comments, '
+        "tokenize = 'unicode61 remove_diacritics 2')",
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    """Индекс поиска зависит от базы, и ORM его не описывает.
+
+    Существующие посты индексируются командой rebuild_search_index.
+    """
+    for sql in CREATE_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute('DROP TABLE posts_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
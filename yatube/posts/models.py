@@ -1,11 +1,19 @@
+from core.images import fill_image_metadata
 from core.models import CreatedModel
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 
 User = get_user_model()
 
+# Ширина одного сегмента материализованного пути комментария.
+COMMENT_PATH_STEP = 10
+COMMENT_PATH_LENGTH = 255
+# Путь хранит id всех предков, поэтому длина поля ограничивает вложенность
+COMMENT_MAX_DEPTH = COMMENT_PATH_LENGTH // COMMENT_PATH_STEP - 1
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -58,11 +66,76 @@ class Post(CreatedModel):
         verbose_name='Изображение',
         help_text='Загрузите изображение'
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Ширина изображения',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Высота изображения',
+    )
+    image_format = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name='Формат изображения',
+    )
+    image_bytes = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Размер изображения в байтах',
+    )
+    image_variants = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения',
+        help_text='JSON-манифест созданных миниатюр',
+    )
+    image_placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Заглушка изображения',
+        help_text='Размытая копия изображения в виде data URI',
+    )
     comments = GenericRelation('comment')
 
+    class Meta(CreatedModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['author', '-created'],
+                name='post_author_created_idx',
+            ),
+            models.Index(
+                fields=['group', '-created'],
+                name='post_group_created_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, 'image')
+        super().save(*args, **kwargs)
+
+
+class CommentQuerySet(models.QuerySet):
+    def thread(self, object_id):
+        """Все комментарии поста в порядке обхода дерева (pre-order)."""
+        return self.filter(object_id=object_id).order_by('path')
+
+    def subtree(self, comment, include_self=True):
+        """Комментарий и все его потомки одним запросом по индексу."""
+        subtree = self.filter(
+            object_id=comment.object_id,
+            path__startswith=comment.path,
+        )
+        if not include_self:
+            subtree = subtree.exclude(pk=comment.pk)
+        return subtree.order_by('path')
+
 
 class Comment(CreatedModel):
     text = models.TextField(
@@ -85,6 +158,28 @@ class Comment(CreatedModel):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     is_child = models.BooleanField(default=False)
+    path = models.CharField(
+        max_length=COMMENT_PATH_LENGTH,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Путь в дереве комментариев',
+    )
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta(CreatedModel.Meta):
+        indexes = [
+            models.Index(
+                fields=['object_id', 'path'],
+                name='comment_thread_path_idx',
+            ),
+            models.Index(
+                fields=['object_id', 'parent', 'created'],
+                name='comment_thread_roots_idx',
+            ),
+        ]
 
     @property
     def get_parent(self):
@@ -92,6 +187,35 @@ class Comment(CreatedModel):
             return ""
         return self.parent
 
+    @property
+    def depth(self):
+        return len(self.path) // COMMENT_PATH_STEP - 1
+
+    @property
+    def can_reply(self):
+        return self.depth < COMMENT_MAX_DEPTH
+
+    def save(self, *args, **kwargs):
+        self.is_child = self.parent_id is not None
+        if not self.path and self.parent_id and not self.parent.can_reply:
+            raise ValidationError(
+                'Слишком глубокая ветка ответов.', code='too_deep'
+            )
+        # Без пути корень читался бы вместе со всей веткой по префиксу ''.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if not self.path:
+                parent_path = self.parent.path if self.parent_id else ''
+                self.path = parent_path + str(self.pk).zfill(
+                    COMMENT_PATH_STEP
+                )
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    def delete(self, *args, **kwargs):
+        if not self.path:
+            return super().delete(*args, **kwargs)
+        return Comment.objects.subtree(self).delete()
+
     def __str__(self):
         return self.text[:15]
 
@@ -122,3 +246,55 @@ class Follow(CreatedModel):
 
     def __str__(self):
         return f'{self.user} follows {self.author}'
+
+
+class FeedEntry(models.Model):
+    """Запись в ленте подписок пользователя.
+
+    Лента материализуется при записи: новый пост попадает в ленты всех
+    подписчиков автора, поэтому чтение ленты сводится к выборке строк
+    читателя по индексу (user, created).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор поста',
+    )
+    created = models.DateTimeField('Дата публикации поста')
+
+    class Meta:
+        ordering = ('-created',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created'],
+                name='feed_entry_user_created_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author_idx',
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.post} in feed of {self.user}'
@@ -0,0 +1,174 @@
+import base64
+import binascii
+import json
+from collections.abc import Sequence
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, obj):
+    value = f'{direction}|{obj.created.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, created, id) или None для битого курсора."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        direction, created, pk = value.split('|')
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        return direction, datetime.fromisoformat(created), int(pk)
+    except (AttributeError, ValueError, binascii.Error):
+        return None
+
+
+class CursorPage(Sequence):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset-пагинация по убыванию (created, id).
+
+    Страница выбирается условием по ключу последней записи, поэтому
+    не нужны ни OFFSET, ни COUNT(*), и любая страница стоит столько же,
+    сколько первая.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    def get_page(self, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        qs = self.object_list
+        if position is None:
+            direction = NEXT
+            qs = qs.order_by('-created', '-pk')
+        else:
+            direction, created, pk = position
+            if direction == NEXT:
+                qs = qs.filter(
+                    Q(created__lt=created) | Q(created=created, pk__lt=pk)
+                ).order_by('-created', '-pk')
+            else:
+                qs = qs.filter(
+                    Q(created__gt=created) | Q(created=created, pk__gt=pk)
+                ).order_by('created', 'pk')
+        items = list(qs[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if direction == PREVIOUS:
+            items.reverse()
+        if not items:
+            return CursorPage(items, self, None, None)
+        if direction == NEXT:
+            has_next, has_previous = has_more, position is not None
+        else:
+            has_next, has_previous = True, has_more
+        return CursorPage(
+            items,
+            self,
+            encode_cursor(NEXT, items[-1]) if has_next else None,
+            encode_cursor(PREVIOUS, items[0]) if has_previous else None,
+        )
+
+
+def count_cache_key(scope):
+    return f'posts_count:{scope}'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по статистике PostgreSQL.
+
+    Для всей таблицы берется pg_class.reltuples, для выборки с условиями
+    - оценка планировщика из EXPLAIN. На других базах возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Точное число объектов кэшируется под ключом count_key и сбрасывается
+    сигналами при изменении постов и подписок. Если статистика базы
+    оценивает выборку не меньше чем в POSTS_COUNT_ESTIMATE_THRESHOLD
+    строк, точный подсчет не выполняется вовсе и используется оценка.
+    """
+
+    def __init__(self, object_list, per_page, count_key, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_cache_key(count_key)
+
+    @cached_property
+    def count(self):
+        count = cache.get(self.count_key)
+        if count is not None:
+            return count
+        count = None
+        if hasattr(self.object_list, 'query'):
+            count = estimate_count(self.object_list)
+        if (
+            count is None
+            or count < settings.POSTS_COUNT_ESTIMATE_THRESHOLD
+        ):
+            count = super().count
+        cache.set(self.count_key, count, settings.POSTS_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def page(self, number):
+        """Срез страницы не обрезается по count, который может быть
+        приблизительным."""
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        return self._get_page(self.object_list[bottom:top], number, self)
@@ -0,0 +1,322 @@
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Comment, Post
+
+TABLE = 'posts_search'
+WORD_RE = re.compile(r'\w+')
+
+_pending = threading.local()
+
+
+def post_comments(post_ids):
+    """Тексты комментариев постов: {id поста: текст через перевод строки}."""
+    if not settings.SEARCH_INCLUDE_COMMENTS:
+        return {}
+    comments = defaultdict(list)
+    for object_id, text in Comment.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id__in=post_ids,
+    ).order_by('path').values_list('object_id', 'text').iterator():
+        comments[object_id].append(text)
+    return {
+        object_id: '\n'.join(texts) for object_id, texts in comments.items()
+    }
+
+
+class SearchBackend:
+    """Поиск по заголовку, тексту и комментариям постов.
+
+    Индекс хранится в той же базе, что и посты, и обновляется в той же
+    транзакции, что и пост, поэтому откат не оставляет его устаревшим.
+    """
+
+    def documents(self, posts):
+        """(id, заголовок, текст, комментарии) для индексации."""
+        comments = post_comments([post.pk for post in posts])
+        return [
+            (post.pk, post.title, post.text, comments.get(post.pk, ''))
+            for post in posts
+        ]
+
+    def index(self, posts):
+        raise NotImplementedError
+
+    def reindex(self, post_ids):
+        """Индексирует заново посты, которые еще существуют."""
+        posts = list(Post.objects.filter(pk__in=post_ids).only(
+            'id', 'title', 'text'
+        ))
+        if posts:
+            self.index(posts)
+
+    def add_comment(self, post_id, text):
+        """Дописывает новый комментарий в документ поста, не перечитывая
+        остальные комментарии."""
+        self.reindex([post_id])
+
+    def remove(self, post_ids):
+        raise NotImplementedError
+
+    def prune(self):
+        """Удаляет из индекса записи постов, которых больше нет."""
+
+    def filter(self, queryset, query):
+        """Посты queryset, подходящие под запрос, без сортировки."""
+        raise NotImplementedError
+
+    def count(self, query):
+        return self.filter(Post.objects.all(), query).count()
+
+    def search(self, query, offset, limit):
+        """id постов страницы результатов в порядке релевантности."""
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(SearchBackend):
+    """Поиск без индекса через icontains для баз без полнотекстового
+    поиска. Результаты сортируются по дате."""
+
+    def index(self, posts):
+        pass
+
+    def reindex(self, post_ids):
+        pass
+
+    def add_comment(self, post_id, text):
+        pass
+
+    def remove(self, post_ids):
+        pass
+
+    def filter(self, queryset, query):
+        condition = Q()
+        for word in WORD_RE.findall(query):
+            condition &= Q(title__icontains=word) | Q(text__icontains=word)
+        return queryset.filter(condition)
+
+    def search(self, query, offset, limit):
+        return list(self.filter(Post.objects.all(), query).values_list(
+            'pk', flat=True
+        )[offset:offset + limit])
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Таблица FTS5 с rowid = id поста, ранжирование по bm25.
+
+    Заголовок весит больше текста, текст больше комментариев. Слова
+    запроса экранируются, последнее ищется по префиксу, чтобы находились
+    другие словоформы.
+    """
+
+    weights = (10.0, 5.0, 1.0)
+
+    def match(self, query):
+        words = WORD_RE.findall(query)
+        if not words:
+            return None
+        return ' '.join(f'"{word}"' for word in words) + '*'
+
+    def index(self, posts):
+        documents = self.documents(posts)
+        with connection.cursor() as cursor:
+            self.remove([document[0] for document in documents])
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (rowid, title, text, comments) '
+                f'VALUES (%s, %s, %s, %s)',
+                documents,
+            )
+
+    def add_comment(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {TABLE} SET comments = comments || char(10) || %s "
+                f"WHERE rowid = %s",
+                [text, post_id],
+            )
+
+    def remove(self, post_ids):
+        if not post_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})',
+                list(post_ids),
+            )
+
+    def prune(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {TABLE} WHERE rowid NOT IN '
+                f'(SELECT id FROM {Post._meta.db_table})'
+            )
+
+    def filter(self, queryset, query):
+        match = self.match(query)
+        if match is None:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', [match]
+        ))
+
+    def count(self, query):
+        match = self.match(query)
+        if match is None:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s',
+                [match],
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, query, offset, limit):
+        match = self.match(query)
+        if match is None:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+                f'ORDER BY bm25({TABLE}, {weights}), rowid DESC '
+                f'LIMIT %s OFFSET %s',
+                [match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """tsvector с весами A/B/C для заголовка, текста и комментариев под
+    GIN-индексом, запрос через websearch_to_tsquery, ранжирование
+    ts_rank_cd. Конфигурация словаря берется из SEARCH_CONFIG.
+    """
+
+    document_sql = (
+        "setweight(to_tsvector(%s::regconfig, %s), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'B') || "
+        "setweight(to_tsvector(%s::regconfig, %s), 'C')"
+    )
+
+    def index(self, posts):
+        config = settings.SEARCH_CONFIG
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (post_id, document) '
+                f'VALUES (%s, {self.document_sql}) '
+                f'ON CONFLICT (post_id) DO UPDATE '
+                f'SET document = EXCLUDED.document',
+                [
+                    (pk, config, title, config, text, config, comments)
+                    for pk, title, text, comments in self.documents(posts)
+                ],
+            )
+
+    def add_comment(self, post_id, text):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {TABLE} SET document = document || "
+                f"setweight(to_tsvector(%s::regconfig, %s), 'C') "
+                f"WHERE post_id = %s",
+                [settings.SEARCH_CONFIG, text, post_id],
+            )
+
+    def remove(self, post_ids):
+        # Записи удаляются каскадом вместе с постом.
+        pass
+
+    def query_sql(self):
+        return 'websearch_to_tsquery(%s::regconfig, %s)'
+
+    def filter(self, queryset, query):
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT post_id FROM {TABLE} '
+            f'WHERE document @@ {self.query_sql()}',
+            [settings.SEARCH_CONFIG, query],
+        ))
+
+    def count(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {TABLE} '
+                f'WHERE document @@ {self.query_sql()}',
+                [settings.SEARCH_CONFIG, query],
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, query, offset, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT post_id FROM {TABLE}, {self.query_sql()} query '
+                f'WHERE document @@ query '
+                f'ORDER BY ts_rank_cd(document, query) DESC, post_id DESC '
+                f'LIMIT %s OFFSET %s',
+                [settings.SEARCH_CONFIG, query, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def reindex_on_commit(post_id):
+    """Индексирует пост заново после коммита, один раз на транзакцию.
+
+    Правка и удаление комментария убирают из документа старый текст,
+    поэтому документ собирается заново. Посты, удаленные в той же
+    транзакции, при этом пропускаются.
+
+    Откат транзакции сбрасывает ее колбэки on_commit, и раз ни одного
+    reindex_pending не осталось, список постов начинается заново, а не
+    переходит в следующую транзакцию.
+    """
+    if not any(
+        callback is reindex_pending
+        for _, callback in transaction.get_connection().run_on_commit
+    ):
+        _pending.post_ids = set()
+    _pending.post_ids.add(post_id)
+    transaction.on_commit(reindex_pending)
+
+
+def reindex_pending():
+    post_ids = getattr(_pending, 'post_ids', None)
+    if post_ids:
+        _pending.post_ids = set()
+        get_backend().reindex(post_ids)
+
+
+def get_backend():
+    """Бэкенд поиска для базы по умолчанию из SEARCH_BACKENDS."""
+    path = settings.SEARCH_BACKENDS.get(
+        connection.vendor, 'posts.search.SimpleSearchBackend'
+    )
+    return import_string(path)()
+
+
+class SearchResults:
+    """Ленивая выборка результатов для Paginator: count() считает
+    совпадения по индексу, срез загружает только посты страницы."""
+
+    def __init__(self, query, backend=None):
+        self.query = query
+        self.backend = backend or get_backend()
+
+    def count(self):
+        return self.backend.count(self.query)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('Поддерживаются только срезы.')
+        offset = index.start or 0
+        ids = self.backend.search(self.query, offset, index.stop - offset)
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,259 @@
+from itertools import islice
+
+from core.signals import image_processed
+from core.storage import (release_deleted_file, release_replaced_file,
+                          remember_file)
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from users.models import Profile
+
+from .cache import bump_versions
+from .feed import (BATCH_SIZE, backfill_feed, fan_out_post, is_pulled,
+                   prune_feed)
+from .follows import invalidate_following
+from .models import Comment, Follow, Group, Post, User
+from .paginators import count_cache_key
+from .search import get_backend, reindex_on_commit
+
+IMAGE_FIELDS = {Post: 'image', Profile: 'avatar'}
+
+
+def invalidate_counts(scopes):
+    cache.delete_many([count_cache_key(scope) for scope in scopes])
+
+
+def invalidate_feed_counts(author_id):
+    """Сбрасывает число постов в лентах подписчиков автора.
+
+    Для авторов, посты которых подмешиваются при чтении гибридной ленты,
+    рассылки нет, и счетчики лент устаревают до истечения таймаута.
+    """
+    if is_pulled(author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator()
+    batch = list(islice(followers, BATCH_SIZE))
+    while batch:
+        invalidate_counts(f'feed:{user_id}' for user_id in batch)
+        batch = list(islice(followers, BATCH_SIZE))
+
+
+def post_scopes(post):
+    scopes = ['index', f'author:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def change_posts_count(author_id, delta):
+    Profile.objects.filter(user_id=author_id).update(
+        posts_count=F('posts_count') + delta
+    )
+
+
+def change_follow_counts(follow, delta):
+    Profile.objects.filter(user_id=follow.user_id).update(
+        following_count=F('following_count') + delta
+    )
+    Profile.objects.filter(user_id=follow.author_id).update(
+        followers_count=F('followers_count') + delta
+    )
+
+
+def bump_post_pages(post, group_ids):
+    scopes = ['index', f'author:{post.author.username}']
+    group_ids = {group_id for group_id in group_ids if group_id}
+    if group_ids:
+        scopes.extend(
+            f'group:{slug}' for slug in Group.objects.filter(
+                pk__in=group_ids
+            ).values_list('slug', flat=True)
+        )
+    bump_versions(scopes)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    if instance.pk:
+        instance._saved_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        change_posts_count(instance.author_id, 1)
+        fan_out_post(instance)
+        invalidate_counts(post_scopes(instance))
+        invalidate_feed_counts(instance.author_id)
+        bump_post_pages(instance, [instance.group_id])
+        return
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    bump_post_pages(instance, [saved_group_id, instance.group_id])
+    if saved_group_id != instance.group_id:
+        invalidate_counts(
+            f'group:{group_id}'
+            for group_id in (saved_group_id, instance.group_id)
+            if group_id
+        )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    change_posts_count(instance.author_id, -1)
+    invalidate_counts(post_scopes(instance))
+    invalidate_feed_counts(instance.author_id)
+    bump_post_pages(instance, [instance.group_id])
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, **kwargs):
+    # В документ входят только заголовок и текст поста.
+    if update_fields and not update_fields & {'title', 'text'}:
+        return
+    get_backend().index([instance])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_backend().remove([instance.pk])
+
+
+def is_indexed_comment(comment):
+    return settings.SEARCH_INCLUDE_COMMENTS and (
+        comment.content_type_id == ContentType.objects.get_for_model(Post).id
+    )
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, created, **kwargs):
+    """Новый комментарий дописывается в документ поста, правка
+    пересобирает документ после коммита."""
+    if not is_indexed_comment(instance):
+        return
+    if created:
+        get_backend().add_comment(instance.object_id, instance.text)
+    else:
+        reindex_on_commit(instance.object_id)
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    if is_indexed_comment(instance):
+        reindex_on_commit(instance.object_id)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Profile)
+def remember_image(sender, instance, **kwargs):
+    remember_file(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Profile)
+def image_saved(sender, instance, **kwargs):
+    release_replaced_file(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Profile)
+def image_deleted(sender, instance, **kwargs):
+    release_deleted_file(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(pre_save, sender=Group)
+def remember_slug(sender, instance, **kwargs):
+    if instance.pk:
+        instance._saved_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    scopes = ['index', f'group:{instance.slug}']
+    saved_slug = getattr(instance, '_saved_slug', None)
+    if saved_slug:
+        scopes.append(f'group:{saved_slug}')
+    bump_versions(scopes)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    bump_versions(['index', f'group:{instance.slug}'])
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and update_fields != frozenset(['last_login']):
+        instance._saved_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Имя автора выводится в карточках постов на всех списках."""
+    if created or update_fields == frozenset(['last_login']):
+        return
+    scopes = ['index', f'author:{instance.username}']
+    saved_username = getattr(instance, '_saved_username', None)
+    if saved_username and saved_username != instance.username:
+        # Страница /profile/<старое имя>/ иначе осталась бы в кэше.
+        scopes.append(f'author:{saved_username}')
+    scopes.extend(
+        f'group:{slug}' for slug in Group.objects.filter(
+            posts__author=instance
+        ).values_list('slug', flat=True).distinct()
+    )
+    bump_versions(scopes)
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    bump_versions([f'author:{instance.user.username}'])
+
+
+@receiver(image_processed, sender=Post)
+def post_image_processed(sender, instance, **kwargs):
+    """Страницы, отрисованные до готовности миниатюр, ссылаются на
+    исходный файл без srcset и заглушки."""
+    bump_post_pages(instance, [instance.group_id])
+
+
+@receiver(image_processed, sender=Profile)
+def avatar_processed(sender, instance, **kwargs):
+    profile_saved(sender, instance)
+
+
+def bump_follow_pages(follow):
+    bump_versions([
+        f'author:{follow.user.username}',
+        f'author:{follow.author.username}',
+    ])
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        change_follow_counts(instance, 1)
+        invalidate_following(instance.user_id)
+        backfill_feed(instance.user_id, instance.author_id)
+        invalidate_counts([f'feed:{instance.user_id}'])
+        bump_follow_pages(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    was_pulled = is_pulled(instance.author_id)
+    change_follow_counts(instance, -1)
+    invalidate_following(instance.user_id)
+    prune_feed(instance.user_id, instance.author_id, was_pulled)
+    invalidate_counts([f'feed:{instance.user_id}'])
+    bump_follow_pages(instance)
@@ -1,12 +1,17 @@
+import hashlib
 import shutil
 import tempfile
+from unittest import mock
 
+from core.images import get_variants
+from core.storage import content_name
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from sorl.thumbnail import default
 
 from ..forms import CommentForm, PostForm
 from ..models import Comment, Group, Post
@@ -77,10 +82,72 @@ class PostFormTests(TestCase):
                 group=self.group,
                 text=self.post.text,
                 author=self.user,
-                image='posts/small.gif'
+                image=content_name(
+                    'posts', hashlib.sha256(small_gif).hexdigest(), '.gif'
+                )
             ).exists()
         )
 
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_create_post_pregenerates_thumbnails(self):
+        """Миниатюры и метаданные изображения создаются при сохранении
+        поста, и рендер страницы не декодирует изображение."""
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        uploaded = SimpleUploadedFile(
+            name='thumb.gif',
+            content=small_gif,
+            content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        post = Post.objects.latest('id')
+        with mock.patch.object(
+            default.engine, 'get_image', wraps=default.engine.get_image
+        ) as get_image:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.id})
+            )
+        self.assertContains(response, 'cache/')
+        self.assertContains(response, 'width="800" height="500"')
+        get_image.assert_not_called()
+        self.assertEqual(
+            (post.image_width, post.image_height, post.image_format,
+             post.image_bytes),
+            (2, 1, 'GIF', len(small_gif)),
+        )
+        variants = get_variants(post, 'image')
+        self.assertEqual(
+            {variant['base'] for variant in variants},
+            {geometry for geometry, _ in settings.THUMBNAIL_PRESETS[
+                'posts.Post.image'
+            ]},
+        )
+        # Картинка 2x1 меньше любого варианта srcset: растягивать ее
+        # дальше базовых размеров незачем.
+        self.assertIn(
+            {'geometry': '800x500', 'format': 'WEBP'},
+            [{'geometry': variant['geometry'], 'format': variant['format']}
+             for variant in variants],
+        )
+        self.assertEqual(
+            {variant['geometry'] for variant in variants},
+            {variant['base'] for variant in variants},
+        )
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertTrue(post.image_placeholder.startswith('data:image/jpeg'))
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, post.image_placeholder)
+
     def test_edit_post_form(self):
         """Валидная форма при редактировании поста
         изменяет запись в Post."""
@@ -99,6 +166,32 @@ class PostFormTests(TestCase):
         post_text = post.text
         self.assertEqual(post_text, form_data['text'])
 
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1)
+    def test_oversized_image_rejected(self):
+        """Форма отклоняет изображение больше лимита пикселей."""
+        posts_count = Post.objects.count()
+        uploaded = SimpleUploadedFile(
+            name='big.gif',
+            content=(
+                b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                b'\x0A\x00\x3B'
+            ),
+            content_type='image/gif'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Слишком большое', 'image': uploaded},
+        )
+        self.assertEqual(
+            response.context['form'].errors.as_data()['image'][0].code,
+            'too_many_pixels',
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+
 
 class CommentFormTests(TestCase):
     @classmethod
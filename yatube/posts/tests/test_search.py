@@ -0,0 +1,145 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Post
+from ..search import SearchResults, reindex_on_commit, reindex_pending
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestAuthor')
+        cls.in_text = Post.objects.create(
+            author=cls.user,
+            title='Прогулка',
+            text='Видели, как лисица ловит зайца',
+        )
+        cls.in_title = Post.objects.create(
+            author=cls.user,
+            title='Лисица',
+            text='Рыжая и хитрая',
+        )
+        cls.other = Post.objects.create(
+            author=cls.user,
+            title='Погода',
+            text='Весь день шел дождь',
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def found(self, query):
+        return [post.pk for post in SearchResults(query)[0:10]]
+
+    def test_ranked_by_field_weight(self):
+        """Совпадение в заголовке важнее совпадения в тексте."""
+        self.assertEqual(
+            self.found('лисица'), [self.in_title.pk, self.in_text.pk]
+        )
+        self.assertEqual(self.found('ловит зайц'), [self.in_text.pk])
+        self.assertEqual(self.found('!!!'), [])
+
+    def test_index_follows_posts_and_comments(self):
+        self.other.text = 'Весь день шел снег'
+        self.other.save()
+        self.assertEqual(self.found('снег'), [self.other.pk])
+        self.assertEqual(self.found('дождь'), [])
+        Comment.objects.create(
+            text='Зато завтра обещают солнце',
+            author=self.user,
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id=self.other.pk,
+        )
+        self.assertEqual(self.found('солнце'), [self.other.pk])
+        self.other.delete()
+        self.assertEqual(SearchResults('снег').count(), 0)
+
+    def comment(self, post, text='Комментарий'):
+        return Comment.objects.create(
+            text=text,
+            author=self.user,
+            content_type=ContentType.objects.get_for_model(Post),
+            object_id=post.pk,
+        )
+
+    def test_comment_cost_does_not_grow_with_thread(self):
+        """Новый комментарий дописывается в документ, а удаление поста
+        не индексирует его заново на каждый комментарий."""
+        queries = []
+        for count in (1, 6):
+            post = Post.objects.create(author=self.user, text=str(count))
+            for _ in range(count):
+                self.comment(post)
+            with CaptureQueriesContext(connection) as added:
+                self.comment(post, 'енот')
+            with CaptureQueriesContext(connection) as deleted:
+                post.delete()
+            queries.append((len(added), len(deleted)))
+        self.assertEqual(queries[0], queries[1])
+
+    @mock.patch(
+        'posts.search.transaction.on_commit', lambda callback: callback()
+    )
+    def test_edited_comment_reindexed(self):
+        comment = self.comment(self.in_title, 'барсук')
+        self.assertEqual(self.found('барсук'), [self.in_title.pk])
+        comment.text = 'енот'
+        comment.save()
+        self.assertEqual(self.found('барсук'), [])
+        self.assertEqual(self.found('енот'), [self.in_title.pk])
+        comment.delete()
+        self.assertEqual(self.found('енот'), [])
+        self.assertEqual(self.found('хитрая'), [self.in_title.pk])
+
+    def test_rolled_back_reindex_not_carried_over(self):
+        """Посты из откатившейся транзакции не индексируются вместе со
+        следующей."""
+        with self.assertRaises(ValueError), transaction.atomic():
+            reindex_on_commit(self.in_text.pk)
+            raise ValueError
+        reindex_on_commit(self.other.pk)
+        with mock.patch('posts.search.get_backend') as get_backend:
+            reindex_pending()
+        get_backend().reindex.assert_called_once_with({self.other.pk})
+
+    def test_post_reindexed_only_when_text_changes(self):
+        post = Post.objects.create(author=self.user, text='Черновик')
+        with mock.patch('posts.signals.get_backend') as get_backend:
+            post.save(update_fields=['group'])
+            get_backend().index.assert_not_called()
+            post.save(update_fields=['text'])
+            get_backend().index.assert_called_once_with([post])
+
+    def test_rebuild_indexes_posts_saved_without_signals(self):
+        Post.objects.bulk_create([
+            Post(author=self.user, title='Импорт', text='Старый архив'),
+        ])
+        post = Post.objects.get(title='Импорт')
+        self.assertEqual(self.found('архив'), [])
+        call_command(
+            'rebuild_search_index', chunk_size=2, stdout=StringIO()
+        )
+        self.assertEqual(self.found('архив'), [post.pk])
+
+    @mock.patch('posts.views.page_size', 1)
+    def test_search_page(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'лисица'})
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+        self.assertEqual(
+            list(response.context['page_obj']), [self.in_title]
+        )
+        self.assertContains(response, '?q=%D0%BB%D0%B8%D1%81')
+        response = self.client.get(reverse('posts:search'))
+        self.assertIsNone(response.context['page_obj'])
@@ -0,0 +1,169 @@
+from django.contrib.auth import get_user_model
+from core.templatetags.comments_tree import comments_filter
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import COMMENT_MAX_DEPTH, Comment, Post
+from ..utils import create_comments_tree, get_comments_page
+
+User = get_user_model()
+
+
+class CommentsTreeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestAuthor')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Тестовый текст',
+        )
+        content_type = ContentType.objects.get(model='post')
+        cls.root = Comment.objects.create(
+            text='Корневой комментарий',
+            author=cls.user,
+            content_type=content_type,
+            object_id=cls.post.id,
+        )
+        cls.child = Comment.objects.create(
+            text='Ответ',
+            author=cls.user,
+            content_type=content_type,
+            object_id=cls.post.id,
+            parent=cls.root,
+            is_child=True,
+        )
+        cls.grandchild = Comment.objects.create(
+            text='Ответ на ответ',
+            author=cls.user,
+            content_type=content_type,
+            object_id=cls.post.id,
+            parent=cls.child,
+            is_child=True,
+        )
+
+    def test_tree_structure(self):
+        """Ответы вложены в родительские комментарии."""
+        tree = create_comments_tree(self.post.comments.all())
+        self.assertEqual(len(tree), 1)
+        root = tree[0]
+        self.assertEqual(root['id'], self.root.id)
+        self.assertEqual(root['parent'], '')
+        child = root['children'][0]
+        self.assertEqual(child['id'], self.child.id)
+        self.assertEqual(child['parent'], self.root)
+        grandchild = child['children'][0]
+        self.assertEqual(grandchild['id'], self.grandchild.id)
+        self.assertNotIn('children', grandchild)
+
+    def test_tree_built_with_single_query(self):
+        """Дерево строится одним запросом вместе с авторами."""
+        comments = self.post.comments.all()
+        with self.assertNumQueries(1):
+            tree = create_comments_tree(comments)
+            self.assertEqual(
+                tree[0]['children'][0]['author'].username,
+                self.user.username
+            )
+
+    def test_comment_path_encodes_ancestors(self):
+        """Путь комментария начинается с пути родителя."""
+        self.assertEqual(self.root.depth, 0)
+        self.assertEqual(self.grandchild.depth, 2)
+        self.assertTrue(self.child.path.startswith(self.root.path))
+        self.assertTrue(self.grandchild.path.startswith(self.child.path))
+
+    def test_reply_depth_limited_by_path_length(self):
+        """Ответ глубже, чем помещается в путь, отклоняется без ошибки
+        базы данных."""
+        parent = self.grandchild
+        while parent.depth < COMMENT_MAX_DEPTH:
+            parent = Comment.objects.create(
+                text='Ответ', author=self.user, parent=parent,
+                content_type=parent.content_type, object_id=self.post.id,
+            )
+        self.assertFalse(parent.can_reply)
+        with self.assertRaises(ValidationError):
+            Comment.objects.create(
+                text='Слишком глубоко', author=self.user, parent=parent,
+                content_type=parent.content_type, object_id=self.post.id,
+            )
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('posts:add_child_comment'), {
+            'user': self.user.username, 'id': parent.id, 'text': 'Ответ',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            Comment.objects.filter(parent=parent).count(), 0
+        )
+
+    def test_subtree_in_pre_order(self):
+        """Поддерево читается одним запросом в порядке обхода."""
+        with self.assertNumQueries(1):
+            subtree = list(Comment.objects.subtree(self.child))
+        self.assertEqual(subtree, [self.child, self.grandchild])
+        self.assertEqual(
+            list(Comment.objects.thread(self.post.id)),
+            [self.root, self.child, self.grandchild]
+        )
+
+    def test_delete_removes_subtree(self):
+        """Удаление комментария удаляет все ответы на него."""
+        self.child.delete()
+        self.assertEqual(
+            list(Comment.objects.thread(self.post.id)), [self.root]
+        )
+
+    def test_comments_filter_renders_nested_tree(self):
+        """Дерево отрисовывается целиком, текст экранируется."""
+        cache.clear()
+        Comment.objects.filter(pk=self.grandchild.pk).update(
+            text='<script>alert(1)</script>'
+        )
+        tree = create_comments_tree(self.post.comments.all())
+        html = comments_filter(tree, self.user.id)
+        self.assertEqual(html.count('<li>'), 3)
+        self.assertEqual(html.count('<ul'), 3)
+        self.assertEqual(html.count('comment_delete'), 3)
+        self.assertNotIn('<script>', html)
+        self.assertIn('&lt;script&gt;', html)
+        self.assertEqual(comments_filter(tree, self.user.id), html)
+        self.assertNotIn('comment_delete', comments_filter(tree, None))
+
+    def test_edited_comment_not_served_from_cache(self):
+        """Правка текста и смена имени автора видны сразу."""
+        cache.clear()
+        comments_filter(
+            create_comments_tree(self.post.comments.all()), self.user.id
+        )
+        Comment.objects.filter(pk=self.root.pk).update(text='Исправлено')
+        User.objects.filter(pk=self.user.pk).update(username='Renamed')
+        html = comments_filter(
+            create_comments_tree(self.post.comments.all()), self.user.id
+        )
+        self.assertIn('Исправлено', html)
+        self.assertEqual(html.count('Renamed'), 3)
+
+    def test_comments_page_loads_only_page_roots(self):
+        """Страница содержит свои корни вместе с ветками."""
+        new_root = Comment.objects.create(
+            text='Новый корневой комментарий',
+            author=self.user,
+            content_type=self.root.content_type,
+            object_id=self.post.id,
+        )
+        with self.assertNumQueries(2):
+            first = get_comments_page(self.post.id, None, 1)
+        self.assertEqual([c['id'] for c in first], [new_root.id])
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+        second = get_comments_page(self.post.id, first.next_cursor, 1)
+        self.assertEqual([c['id'] for c in second], [self.root.id])
+        self.assertEqual(second[0]['children'][0]['id'], self.child.id)
+        self.assertFalse(second.has_next())
+        previous = get_comments_page(self.post.id, second.previous_cursor, 1)
+        self.assertEqual([c['id'] for c in previous], [new_root.id])
+        self.assertFalse(previous.has_previous())
@@ -1,15 +1,23 @@
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from users.models import Profile
 
-from ..models import Follow, Group, Post
+from ..cache import LOCK_KEY, get_or_recompute, get_versions, page_cache_key
+from ..follows import followed_authors
+from ..models import FeedEntry, Follow, Group, Post
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
@@ -141,6 +149,20 @@ class PostPagesTests(TestCase):
         self.check_post_attributes(post)
         self.assertEqual(amount, 1)
 
+    def test_author_posts_count_follows_changes(self):
+        """Счетчик постов автора меняется при создании и удалении поста
+        и восстанавливается командой recount_posts."""
+        post = Post.objects.create(text='Еще пост', author=self.user)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.posts_count, 2)
+        post.delete()
+        Profile.objects.filter(user=self.user).update(posts_count=0)
+        call_command('recount_posts', stdout=StringIO())
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertEqual(response.context['amount'], 1)
+
     def test_create_edit_pages_show_correct_context(self):
         """Шаблоны страниц создания и редактирования
         постов сформированы с правильным контекстом."""
@@ -189,20 +211,118 @@ class PostPagesTests(TestCase):
             group=self.group_2,
             author=self.user,
         )
-        content_before_delete = self.authorized_client.get(
+        content_before_update = self.authorized_client.get(
+            reverse('posts:index')).content
+        Post.objects.filter(pk=test_post.pk).update(text='Без сигналов')
+        content_after_update = self.authorized_client.get(
             reverse('posts:index')).content
         test_post.delete()
         content_after_delete = self.authorized_client.get(
             reverse('posts:index')).content
-        cache.clear()
-        content_after_cache_clear = self.authorized_client.get(
-            reverse('posts:index')).content
         self.assertEqual(
-            content_before_delete, content_after_delete
+            content_before_update, content_after_update
         )
         self.assertNotEqual(
-            content_before_delete, content_after_cache_clear
+            content_before_update, content_after_delete
+        )
+
+    def test_cached_pages_invalidated_by_signals(self):
+        """Изменения постов и групп сразу видны на закэшированных
+        страницах группы и профиля."""
+        urls = [
+            reverse('posts:group_list', kwargs={'slug': self.group_1.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        for url in urls:
+            self.authorized_client.get(url)
+        new_post = Post.objects.create(
+            text='Новый пост для кэша',
+            group=self.group_1,
+            author=self.user,
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, new_post.text)
+        new_post.group = self.group_2
+        new_post.save()
+        response = self.authorized_client.get(urls[0])
+        self.assertNotContains(response, new_post.text)
+
+    def test_cached_page_shared_between_users(self):
+        """Страница кэшируется одна на всех, а фрагменты пользователя
+        подставляются в нее после чтения кэша."""
+        reader = User.objects.create_user(username='Reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        url = reverse('posts:profile', kwargs={'username': self.user.username})
+        response = Client().get(url)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Подписаться')
+        for client, text in (
+            (reader_client, 'Подписаться'),
+            (self.authorized_client, 'Редактировать профиль'),
+        ):
+            with self.subTest(text=text):
+                response = client.get(url)
+                self.assertNotIn(
+                    'posts/profile.html',
+                    [template.name for template in response.templates],
+                )
+                self.assertContains(response, text)
+                self.assertNotContains(response, 'Войти')
+
+    def test_post_cards_follow_author_name(self):
+        """Карточки постов берутся из кэша и обновляются при смене имени
+        автора."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with self.assertTemplateNotUsed('posts/includes/post_list.html'):
+            self.client.get(url, {'page': 1})
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Новое'
+        author.last_name = 'Имя'
+        author.save()
+        self.assertContains(self.client.get(url), 'Новое Имя')
+
+    def test_renamed_author_old_profile_not_cached(self):
+        """После смены username страница профиля по старому имени не
+        отдается из кэша."""
+        author = User.objects.create_user(username='OldName')
+        url = reverse('posts:profile', kwargs={'username': 'OldName'})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        author.username = 'NewName'
+        author.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_stale_page_served_while_locked(self):
+        """Пока другой запрос пересчитывает страницу, отдается старая
+        копия, а после снятия блокировки - новая."""
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
+        key = page_cache_key(response.wsgi_request)
+        new_post = Post.objects.create(text='Пост под блокировкой',
+                                       author=self.user)
+        cache.add(LOCK_KEY.format(key), True)
+        self.assertNotContains(
+            self.authorized_client.get(url), new_post.text
         )
+        cache.delete(LOCK_KEY.format(key))
+        self.assertContains(self.authorized_client.get(url), new_post.text)
+
+    @override_settings(CACHE_LOCK_TIMEOUT=0.1, CACHE_LOCK_POLL_INTERVAL=0.05)
+    def test_waiters_timed_out_leave_lock_alone(self):
+        """Запросы, не дождавшиеся пересчета, считают страницу для себя
+        и не снимают чужую блокировку и не пишут запись."""
+        key = 'page:slow'
+        cache.add(LOCK_KEY.format(key), 'owner')
+        values = [
+            get_or_recompute(key, lambda: caller, 60)
+            for caller in ('first', 'second')
+        ]
+        self.assertEqual(values, ['first', 'second'])
+        self.assertEqual(cache.get(LOCK_KEY.format(key)), 'owner')
+        self.assertIsNone(cache.get(key))
 
 
 class FollowTests(TestCase):
@@ -252,6 +372,84 @@ class FollowTests(TestCase):
             Follow.objects.filter(user=self.user2, author=self.user3).exists()
         )
 
+    def test_profile_save_keeps_counters(self):
+        """Сохранение пользователя с устаревшим профилем в памяти не
+        сбрасывает счетчики."""
+        author = User.objects.select_related('profile').get(pk=self.user.pk)
+        before = (author.profile.posts_count, author.profile.followers_count)
+        Post.objects.create(text='Еще пост', author=self.user)
+        Follow.objects.create(user=self.user3, author=self.user)
+        author.first_name = 'Новое имя'
+        author.save()
+        author.profile.city = 'Москва'
+        author.profile.save()
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(
+            (profile.posts_count, profile.followers_count, profile.city),
+            (before[0] + 1, before[1] + 1, 'Москва'),
+        )
+
+    def test_profile_counters_not_saved_directly(self):
+        with self.assertRaises(ValueError):
+            self.user.profile.save(update_fields=['posts_count'])
+
+    def test_login_does_not_touch_profile(self):
+        """Вход на сайт обновляет только last_login и не сбрасывает
+        кэш страницы автора."""
+        scope = f'author:{self.user.username}'
+        before = get_versions([scope])
+        with mock.patch.object(Profile, 'save') as save:
+            self.client.force_login(self.user)
+            self.assertEqual(get_versions([scope]), before)
+            # Профиль не загружен, значит, и меняться в нем нечему.
+            User.objects.get(pk=self.user.pk).save()
+        save.assert_not_called()
+
+    def test_follow_counters_and_batch_lookup(self):
+        """Счетчики подписок обновляются, а состояние подписки на
+        несколько авторов определяется одним запросом."""
+        self.authorized_follower.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user.username}))
+        self.user.profile.refresh_from_db()
+        self.user2.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.followers_count, 1)
+        self.assertEqual(self.user2.profile.following_count, 2)
+        with self.assertNumQueries(1):
+            followed = followed_authors(
+                self.user2, [self.user, self.user3.id, self.user2]
+            )
+        self.assertEqual(followed, {self.user.id, self.user3.id})
+        with self.assertNumQueries(0):
+            followed_authors(self.user2, [self.user])
+
+    def test_follow_buttons_on_cards(self):
+        """Карточки общей закэшированной ленты показывают состояние
+        подписки текущего пользователя, подписки читаются один раз."""
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(text=text, author=self.user)
+            Post.objects.create(text=text, author=self.user3)
+        unfollow = reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user3.username}
+        )
+        follow = reverse(
+            'posts:profile_follow', kwargs={'username': self.user.username}
+        )
+        self.authorized_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_follower.get(reverse('posts:index'))
+        self.assertContains(response, f'href="{unfollow}"', count=2)
+        self.assertContains(response, f'href="{follow}"', count=2)
+        self.assertEqual(
+            sum('posts_follow' in query['sql'] for query in queries), 1
+        )
+        response = self.authorized_not_follower.get(reverse('posts:index'))
+        self.assertNotContains(response, unfollow)
+        self.assertNotContains(response, reverse(
+            'posts:profile_follow', kwargs={'username': self.user3.username}
+        ))
+        self.assertContains(response, f'href="{follow}"', count=2)
+
     def test_author_post_appear_in_newsfeed(self):
         """Новая запись пользователя появляется
         в ленте тех, кто на него подписан"""
@@ -267,6 +465,106 @@ class FollowTests(TestCase):
         )
         self.assertIn(new_post, response.context['page_obj'].object_list)
 
+    def test_feed_entries_follow_lifecycle(self):
+        """Подписка переносит посты автора в ленту, отписка убирает их."""
+        post = Post.objects.create(text='Старый пост', author=self.user)
+        self.authorized_follower.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user.username}))
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user2, post=post).exists()
+        )
+        self.authorized_follower.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.user.username}))
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.user2, author=self.user).exists()
+        )
+
+    @override_settings(FEED_MODE='hybrid', FEED_FANOUT_THRESHOLD=1)
+    def test_hybrid_feed_pulls_popular_authors(self):
+        """Посты популярных авторов не рассылаются,
+        а подмешиваются в ленту при чтении."""
+        own_post = Post.objects.create(text='Пост автора', author=self.user2)
+        self.authorized_not_follower.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.user2.username}))
+        new_post = Post.objects.create(
+            text='Новый пост популярного автора', author=self.user3
+        )
+        self.assertFalse(
+            FeedEntry.objects.filter(post=new_post).exists()
+        )
+        response = self.authorized_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertIn(new_post, response.context['page_obj'].object_list)
+        response = self.authorized_not_follower.get(
+            reverse('posts:follow_index')
+        )
+        self.assertEqual(
+            list(response.context['page_obj'].object_list), [own_post]
+        )
+
+    @override_settings(
+        FEED_MODE='hybrid', FEED_FANOUT_THRESHOLD=2, FEED_WORKERS=0
+    )
+    def test_feeds_backfilled_after_commit_when_author_drops(self):
+        """Когда автор опускается ниже порога, ленты подписчиков
+        дозаполняются после коммита пачками, а не в запросе отписки."""
+        Post.objects.create(text='Первый', author=self.user)
+        Post.objects.create(text='Второй', author=self.user)
+        # Автор уже популярен: его посты не разосланы подписчикам.
+        Follow.objects.bulk_create([
+            Follow(user=self.user2, author=self.user),
+            Follow(user=self.user3, author=self.user),
+        ])
+        Profile.objects.filter(user=self.user).update(followers_count=2)
+        Profile.objects.filter(user=self.user3).update(following_count=1)
+        with mock.patch('posts.feed.transaction.on_commit') as on_commit:
+            self.authorized_not_follower.get(
+                reverse('posts:profile_unfollow',
+                        kwargs={'username': self.user.username}))
+        self.assertFalse(FeedEntry.objects.filter(author=self.user).exists())
+        backfill, = on_commit.call_args[0]
+        with self.assertNumQueries(4):
+            backfill()
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.user2, author=self.user).count(),
+            2,
+        )
+
+    @override_settings(
+        FEED_MODE='hybrid', FEED_FANOUT_THRESHOLD=3, FEED_WORKERS=0
+    )
+    def test_feeds_backfilled_when_drop_skips_threshold(self):
+        """Ленты дозаполняются, даже если счетчик перескочил порог:
+        например, параллельные отписки уменьшили его сразу на двоих."""
+        Post.objects.create(text='Первый', author=self.user)
+        Follow.objects.bulk_create([
+            Follow(user=self.user2, author=self.user),
+            Follow(user=self.user3, author=self.user),
+        ])
+        Profile.objects.filter(user=self.user).update(followers_count=3)
+        Profile.objects.filter(user=self.user3).update(following_count=1)
+
+        def concurrent_drop(follow, delta):
+            Profile.objects.filter(user_id=follow.author_id).update(
+                followers_count=1
+            )
+
+        with mock.patch('posts.signals.change_follow_counts',
+                        concurrent_drop), \
+                mock.patch('posts.feed.transaction.on_commit') as on_commit:
+            self.authorized_not_follower.get(
+                reverse('posts:profile_unfollow',
+                        kwargs={'username': self.user.username}))
+        backfill, = on_commit.call_args[0]
+        backfill()
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user2, author=self.user).exists()
+        )
+
     def test_post_not_in_wrong_newsfeed(self):
         """Новая запись пользователя не появляется
         в ленте тех, кто на него не подписан"""
@@ -327,3 +625,47 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(url=url):
                 response = self.authorized_client.get(url + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 3)
+
+    @override_settings(POSTS_PAGINATOR='cursor')
+    def test_cursor_pagination(self):
+        """Курсорная пагинация листает списки постов без COUNT(*)."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.get(url)
+                self.assertFalse(any(
+                    'COUNT(' in query['sql'] and 'posts_post' in query['sql']
+                    for query in queries.captured_queries
+                ))
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), 10)
+                self.assertFalse(page_obj.has_previous())
+                response = self.authorized_client.get(
+                    url, {'cursor': page_obj.next_cursor}
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(len(page_obj), 3)
+                self.assertFalse(page_obj.has_next())
+                self.assertTrue(page_obj.has_previous())
+
+    def test_paginator_count_is_cached(self):
+        """Число постов берется из кэша и сбрасывается новым постом."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.authorized_client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url, {'page': 1})
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
+        self.assertEqual(response.context['page_obj'].paginator.count, 13)
+        Post.objects.create(
+            text='Новый пост', group=self.group, author=self.user
+        )
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 14)
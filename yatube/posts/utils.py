@@ -1,35 +1,78 @@
+from django.conf import settings
+from django.db.models import Q
+
 from .models import Comment
+from .paginators import CachedCountPaginator, CursorPaginator
 
+page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+
+
+def comment_to_dict(comment, parent=''):
+    return {
+        'id': comment.id,
+        'text': comment.text,
+        'author': comment.author,
+        'created': comment.created,
+        'is_child': comment.is_child,
+        'parent': parent,
+    }
 
-def get_children(qs_child):
-    res = []
-    for comment in qs_child:
-        c = {
-                'id': comment.id,
-                'text': comment.text,
-                'author': comment.author,
-                'created': comment.created,
-                'is_child': comment.is_child,
-                'parent': comment.get_parent
-        }
-        if comment.comment_children.exists():
-            c['children'] = get_children(comment.comment_children.all())
-        res.append(c)
-    return res
 
 def create_comments_tree(qs):
+    """Собирает дерево комментариев за один запрос к базе.
+
+    Все комментарии выбираются вместе с авторами, после чего вложенная
+    структура строится в памяти за один проход по словарю узлов.
+    Порядок корневых комментариев и ответов совпадает с порядком qs.
+    """
+    comments = list(qs.select_related('author'))
+    by_id = {comment.id: comment for comment in comments}
+    nodes = {}
+    for comment in comments:
+        parent = by_id.get(comment.parent_id, '')
+        nodes[comment.id] = comment_to_dict(comment, parent)
     res = []
-    for comment in qs:
-        c = {
-                'id': comment.id,
-                'text': comment.text,
-                'author': comment.author,
-                'created': comment.created,
-                'is_child': comment.is_child,
-                'parent': comment.get_parent
-        }
-        if comment.comment_children:
-            c['children'] = get_children(comment.comment_children.all())
-        if not comment.is_child:
-            res.append(c)
-    return res
\ No newline at end of file
+    for comment in comments:
+        node = nodes[comment.id]
+        if comment.parent_id is None:
+            res.append(node)
+        elif comment.parent_id in nodes:
+            nodes[comment.parent_id].setdefault('children', []).append(node)
+    return res
+
+
+def get_comments_page(object_id, cursor, per_page):
+    """Страница дерева комментариев поста.
+
+    Корневые комментарии пагинируются в базе по курсору, затем одним
+    запросом по префиксам путей загружаются только их ветки.
+    """
+    roots = Comment.objects.filter(
+        object_id=object_id, parent__isnull=True
+    ).only('id', 'created', 'path')
+    page = CursorPaginator(roots, per_page).get_page(cursor)
+    if not page.object_list:
+        return page
+    branches = Q()
+    for root in page.object_list:
+        branches |= Q(path__startswith=root.path)
+    comments = Comment.objects.filter(
+        branches, object_id=object_id
+    ).order_by('-created', '-id')
+    page.object_list = create_comments_tree(comments)
+    return page
+
+
+def paginate_posts(request, post_list, count_key):
+    """Страница списка постов.
+
+    По умолчанию используется Paginator с номерами страниц, число постов
+    для которого берется из кэша под ключом count_key. При
+    POSTS_PAGINATOR = 'cursor' списки листаются по курсору ?cursor=
+    без OFFSET и COUNT(*).
+    """
+    if settings.POSTS_PAGINATOR == 'cursor':
+        paginator = CursorPaginator(post_list, page_size)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = CachedCountPaginator(post_list, page_size, count_key)
+    return paginator.get_page(request.GET.get('page'))
@@ -1,25 +1,29 @@
+from urllib.parse import urlencode
+
+from core.thumbnails import schedule_thumbnails
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
 from django.core.paginator import Paginator
 from django.db import transaction
+from django.http import HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from .cache import cache_page_versioned
+from .feed import get_feed
 from .forms import CommentForm, PostForm
 from .models import Comment, Follow, Group, Post, User
-from .utils import create_comments_tree
+from .search import SearchResults
+from .utils import get_comments_page, paginate_posts
 
 page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_page_versioned(lambda: ['index'])
 def index(request):
     post_list = Post.objects.select_related(
         'author').select_related('group').all()
-    paginator = Paginator(post_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate_posts(request, post_list, 'index')
     groups = Group.objects.all()
     posts = Post.objects.all()[:5]
     context = {
@@ -30,14 +34,11 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@cache_page_versioned(lambda slug: [f'group:{slug}'])
 def group_posts(request, slug):
-    group = get_object_or_404(
-        Group.objects.prefetch_related('posts'), slug=slug
-    )
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = get_object_or_404(Group, slug=slug)
+    post_list = group.posts.select_related('author', 'group')
+    page_obj = paginate_posts(request, post_list, f'group:{group.id}')
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -45,44 +46,42 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_page_versioned(lambda username: [f'author:{username}'])
 def profile(request, username):
     author = get_object_or_404(
-        User.objects.prefetch_related('posts'), username=username
+        User.objects.select_related('profile'), username=username
     )
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    author = User.objects.get(username=username)
-    if (
-        not request.user.is_authenticated
-        or request.user == author
-    ):
-        context = {
-            'page_obj': page_obj,
-            'author': author,
-        }
-        return render(request, 'posts/profile.html', context)
-    following = Follow.objects.filter(
-        user=request.user, author=author).exists()
+    post_list = author.posts.select_related('author', 'group')
+    page_obj = paginate_posts(request, post_list, f'author:{author.id}')
     context = {
         'page_obj': page_obj,
         'author': author,
-        'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = Paginator(SearchResults(query), page_size)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 def post_detail(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related(
-            'author').select_related('group'), pk=post_id)
-    amount = post.author.posts.count()
-    comments = post.comments.all()
-    comment_list = create_comments_tree(comments)
-    paginator = Paginator(comment_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+            'author__profile').select_related('group'), pk=post_id)
+    amount = post.author.profile.posts_count
+    page_obj = get_comments_page(
+        post.id, request.GET.get('cursor'), page_size
+    )
     form = CommentForm()
     context = {
         'post': post,
@@ -100,6 +99,7 @@ def post_create(request):
         f = form.save(commit=False)
         f.author = request.user
         form.save()
+        schedule_thumbnails(f, 'image')
         return redirect('posts:profile', f.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -115,6 +115,8 @@ def post_edit(request, post_id):
         instance=post)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            schedule_thumbnails(post, 'image')
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -155,9 +157,13 @@ def add_child_comment(request):
     username = request.POST.get('user')
     current_id = request.POST.get('id')
     text = request.POST.get('text')
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
     content_type = ContentType.objects.get(model='post')
     parent = Comment.objects.get(id=int(current_id))
+    if not parent.can_reply:
+        return HttpResponseBadRequest('Слишком глубокая ветка ответов.')
     object_id = parent.object_id
     is_child = False if not parent else True
     post = get_object_or_404(Post, pk=object_id)
@@ -165,11 +171,9 @@ def add_child_comment(request):
         author=author, text=text, content_type=content_type,
         object_id=object_id, parent=parent, is_child=is_child
     )
-    comments_ = post.comments.all()
-    comment_list = create_comments_tree(comments_)
-    paginator = Paginator(comment_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_comments_page(
+        post.id, request.GET.get('cursor'), page_size
+    )
     form = CommentForm()
     context = {
         'post': post,
@@ -193,10 +197,8 @@ def delete_comment(request, comment_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, page_size)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post_list = get_feed(request.user)
+    page_obj = paginate_posts(request, post_list, f'feed:{request.user.id}')
     context = {
         'page_obj': page_obj
     }
@@ -205,7 +207,9 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
     if request.user != author:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
@@ -213,7 +217,9 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username
+    )
     follow = get_object_or_404(Follow, user=request.user, author=author)
     follow.delete()
     return redirect('posts:profile', username=username)
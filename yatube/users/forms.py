@@ -1,6 +1,8 @@
+from core.images import validate_upload
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
+from django.core.files.uploadedfile import UploadedFile
 
 from .models import Profile
 
@@ -17,3 +19,9 @@ class ProfileEditForm(forms.ModelForm):
     class Meta:
         model = Profile
         fields = ('status', 'date_of_birth', 'city', 'avatar')
+
+    def clean_avatar(self):
+        avatar = self.cleaned_data['avatar']
+        if isinstance(avatar, UploadedFile):
+            validate_upload(avatar)
+        return avatar
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from posts.models import Post
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики постов в профилях пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пересчитать только для указанных пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(
+            author=OuterRef('user')
+        ).order_by().values('author').annotate(
+            count=Count('pk')
+        ).values('count')
+        profiles = Profile.objects.all()
+        if options['usernames']:
+            profiles = profiles.filter(
+                user__username__in=options['usernames']
+            )
+        updated = profiles.update(posts_count=Coalesce(
+            Subquery(posts, output_field=IntegerField()), 0
+        ))
+        self.stdout.write(f'Обновлено профилей: {updated}')
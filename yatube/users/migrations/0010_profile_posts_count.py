@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_posts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Profile = apps.get_model('users', 'Profile')
+    posts = Post.objects.filter(
+        author=OuterRef('user')
+    ).order_by().values('author').annotate(count=Count('pk')).values('count')
+    Profile.objects.update(posts_count=Coalesce(
+        Subquery(posts, output_field=IntegerField()), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_post_listing_indexes'),
+        ('users', '0009_auto_20211227_1010'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:40
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Profile = apps.get_model('users', 'Profile')
+
+    def counter(field):
+        follows = Follow.objects.filter(
+            **{field: OuterRef('user')}
+        ).order_by().values(field).annotate(count=Count('pk')).values('count')
+        return Coalesce(Subquery(follows, output_field=IntegerField()), 0)
+
+    Profile.objects.update(
+        followers_count=counter('author'),
+        following_count=counter('user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_profile_posts_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число подписок'),
+        ),
+        migrations.RunPython(count_follows, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+from core.images import fill_image_metadata
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models.signals import post_save
@@ -5,6 +6,9 @@ from django.dispatch import receiver
 
 User = get_user_model()
 
+# Счетчики меняются только атомарными update(F(...)) в posts.signals
+COUNTER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+
 
 class Profile(models.Model):
     user = models.OneToOneField(
@@ -19,7 +23,49 @@ class Profile(models.Model):
         verbose_name='Изображение',
         help_text='Загрузите изображение'
     )
+    avatar_width = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Ширина изображения',
+    )
+    avatar_height = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Высота изображения',
+    )
+    avatar_format = models.CharField(
+        max_length=10,
+        blank=True,
+        editable=False,
+        verbose_name='Формат изображения',
+    )
+    avatar_bytes = models.PositiveIntegerField(
+        null=True,
+        editable=False,
+        verbose_name='Размер изображения в байтах',
+    )
+    avatar_variants = models.TextField(
+        blank=True,
+        editable=False,
+        verbose_name='Варианты изображения',
+        help_text='JSON-манифест созданных миниатюр',
+    )
     status = models.CharField(max_length=300, blank=True, null=True)
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число постов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число подписок',
+    )
 
     class Meta:
         verbose_name_plural = 'Профили'
@@ -28,11 +74,36 @@ class Profile(models.Model):
     def __str__(self):
         return f'Profile for user {self.user.username}'
 
+    def save(self, *args, **kwargs):
+        fill_image_metadata(self, 'avatar')
+        if not self._state.adding:
+            # Значения счетчиков в памяти могут быть устаревшими, полное
+            # сохранение профиля затерло бы их.
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in COUNTER_FIELDS
+                ]
+            elif set(update_fields) & set(COUNTER_FIELDS):
+                raise ValueError(
+                    'Счетчики профиля меняются только через update(F(...)), '
+                    'а не через save().'
+                )
+        super().save(*args, **kwargs)
+
     @receiver(post_save, sender=User)
     def create_user_profile(sender, instance, created, **kwargs):
         if created:
             Profile.objects.create(user=instance)
 
     @receiver(post_save, sender=User)
-    def save_user_profile(sender, instance, **kwargs):
-        instance.profile.save()
+    def save_user_profile(sender, instance, created, update_fields=None,
+                          **kwargs):
+        # Профиль мог измениться, только если он загружен вместе с
+        # пользователем; вход на сайт обновляет лишь last_login.
+        if created or update_fields == frozenset(['last_login']):
+            return
+        if User.profile.related.is_cached(instance):
+            instance.profile.save()
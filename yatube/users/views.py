@@ -1,3 +1,4 @@
+from core.thumbnails import schedule_thumbnails
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
@@ -22,5 +23,7 @@ def update_profile(request):
         instance=profile)
     if form.is_valid():
         form.save()
+        if 'avatar' in form.changed_data:
+            schedule_thumbnails(profile, 'avatar')
         return redirect('posts:profile', username=request.user.username)
     return render(request, 'users/update_profile.html', {'form': form})
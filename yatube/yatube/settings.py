@@ -118,6 +118,15 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Пагинация списков постов: offset (номера страниц) или cursor (keyset)
+POSTS_PAGINATOR = os.getenv('POSTS_PAGINATOR', default='offset')
+
+# Число постов для пагинатора кэшируется и сбрасывается при изменениях.
+# Выборки, которые статистика PostgreSQL оценивает больше порога,
+# не пересчитываются точно
+POSTS_COUNT_CACHE_TIMEOUT = 60 * 60
+POSTS_COUNT_ESTIMATE_THRESHOLD = 100000
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.2/topics/i18n/
 
@@ -142,6 +151,78 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузки называются по хэшу содержимого и раскладываются по вложенным
+# каталогам, одинаковые файлы хранятся один раз (core.storage)
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# Миниатюры sorl-thumbnail ищет по имени, которое он сам выбрал, поэтому
+# их хранилище не должно переименовывать файлы
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+
+# Размеры изображений в шаблонах. Теги responsive_image и resized_url
+# принимают имя размера, так что геометрия задается только здесь
+IMAGE_SIZES = {
+    'post_card': '800x400',
+    'post_detail': '800x500',
+    'profile_card': '900x500',
+    'avatar': '350x350',
+}
+
+# Миниатюры, которые создаются в фоне сразу после загрузки изображения
+# (core.thumbnails). При THUMBNAIL_WORKERS = 0 миниатюры создаются в
+# потоке запроса. SQLite допускает одного пишущего, и фоновые потоки
+# только спорили бы с запросами за блокировку базы. Аватары выводятся
+# через core.resize, для них загрузка только нормализуется
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+THUMBNAIL_PRESETS = {
+    'posts.Post.image': [
+        (IMAGE_SIZES[size], THUMBNAIL_OPTIONS)
+        for size in ('post_card', 'post_detail', 'profile_card')
+    ],
+    'users.Profile.avatar': [],
+}
+THUMBNAIL_WORKERS = int(
+    os.getenv('THUMBNAIL_WORKERS', default=0 if USE_SQLITE else 2)
+)
+
+# Адаптивные варианты миниатюр для srcset и <picture>: каждый пресет поля
+# из THUMBNAIL_RESPONSIVE создается еще в масштабах THUMBNAIL_SRCSET_SCALES
+# и форматах THUMBNAIL_SRCSET_FORMATS (неподдерживаемые Pillow форматы
+# пропускаются). THUMBNAIL_FORMAT остается запасным для старых браузеров
+THUMBNAIL_BACKEND = 'core.thumbnails.ThumbnailBackend'
+THUMBNAIL_FORMAT = 'JPEG'
+THUMBNAIL_RESPONSIVE = {'posts.Post.image'}
+THUMBNAIL_SRCSET_SCALES = (0.5, 1, 1.5)
+THUMBNAIL_SRCSET_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+
+# Сторона размытой заглушки изображения поста, которая показывается, пока
+# миниатюра загружается лениво, в пикселях
+IMAGE_PLACEHOLDER_SIZE = 16
+
+# Загрузки изображений (core.images). В запросе формы проверяют только
+# размер файла и число пикселей по заголовку. Поворот по EXIF, удаление
+# метаданных, уменьшение до IMAGE_UPLOAD_MAX_SIDE и перекодирование
+# выполняются в фоне перед созданием миниатюр. Изображения в форматах
+# IMAGE_UPLOAD_FORMATS без других проблем сохраняются как есть
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50 * 10 ** 6
+IMAGE_UPLOAD_MAX_SIDE = 2560
+IMAGE_UPLOAD_QUALITY = 85
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+# Варианты изображений по подписанным адресам
+# /media/resize/<подпись>/<ширина>x<высота>/<путь> (core.resize). Готовые
+# файлы лежат в MEDIA_ROOT/RESIZE_CACHE_DIR и отдаются nginx напрямую
+RESIZE_CACHE_DIR = 'resize'
+RESIZE_MAX_SIDE = 2000
+
+# Записи KV-хранилища sorl дополнительно кэшируются в памяти процесса
+# (core.kvstore): до THUMBNAIL_LRU_SIZE записей на THUMBNAIL_LRU_TIMEOUT
+# секунд. Удаления из других воркеров замечаются не позже чем через
+# THUMBNAIL_LRU_CHECK_INTERVAL секунд
+THUMBNAIL_KVSTORE = 'core.kvstore.LRUKVStore'
+THUMBNAIL_LRU_SIZE = 10000
+THUMBNAIL_LRU_TIMEOUT = 60 * 5
+THUMBNAIL_LRU_CHECK_INTERVAL = 5
 
 
 LOGIN_URL = 'users:login'
@@ -156,9 +237,69 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 
-# Настройка подсистемы кэширования
+# Настройка подсистемы кэширования. CACHE_BACKEND выбирает хранилище:
+# locmem - отдельный кэш в каждом процессе, sqlite - общий для всех
+# воркеров хоста файл в CACHE_LOCATION. Любой другой путь к классу
+# (например, сетевого кэша) передается Django как есть
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', default='locmem')
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=(
+                os.path.join(BASE_DIR, 'cache', 'cache.sqlite3')
+                if CACHE_BACKEND == 'sqlite' else ''
+            ),
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
     }
 }
+
+# Время жизни закэшированных страниц списков постов, в секундах. Страницы
+# сбрасываются сигналами через версии областей кэша (posts.cache)
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Защита от одновременного пересчета записей кэша (posts.cache): пока
+# один запрос пересчитывает запись, остальные отдают старую копию, которая
+# хранится на CACHE_STALE_TIMEOUT дольше своего срока. Блокировка
+# пересчета живет не дольше CACHE_LOCK_TIMEOUT, в секундах
+CACHE_STALE_TIMEOUT = 60 * 5
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Время жизни закэшированных карточек комментариев, в секундах
+COMMENTS_CACHE_TIMEOUT = 60 * 60
+
+# Время жизни закэшированных карточек постов, в секундах. Ключ карточки
+# меняется вместе с постом, именем автора и группой
+POST_CARDS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Лента подписок: pull, push или hybrid. В гибридном режиме посты авторов,
+# у которых подписчиков не меньше порога, подмешиваются при чтении ленты
+FEED_MODE = os.getenv('FEED_MODE', default='hybrid')
+FEED_FANOUT_THRESHOLD = 1000
+# Потоки для дозаполнения лент, когда автор опускается ниже порога.
+# При 0 ленты дозаполняются после коммита в потоке запроса, как и
+# миниатюры на SQLite
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', default=0 if USE_SQLITE else 1))
+
+# Время жизни кэша подписок пользователя, в секундах
+FOLLOWING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Полнотекстовый поиск по постам (posts.search): бэкенд выбирается по
+# движку базы, для остальных баз используется поиск через icontains.
+# SEARCH_CONFIG - конфигурация словаря PostgreSQL для стемминга
+SEARCH_BACKENDS = {
+    'postgresql': 'posts.search.PostgresSearchBackend',
+    'sqlite': 'posts.search.SQLiteSearchBackend',
+}
+SEARCH_CONFIG = 'russian'
+SEARCH_INCLUDE_COMMENTS = True
@@ -1,3 +1,4 @@
+from core.views import resize_image
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
@@ -5,6 +6,12 @@ from django.urls import include, path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path(
+        settings.MEDIA_URL.lstrip('/')
+        + 'resize/<str:signature>/<str:geometry>/<path:name>',
+        resize_image,
+        name='resize_image',
+    ),
     path('auth/', include(('users.urls'), namespace='users')),
     path('auth/', include('django.contrib.auth.urls')),
     path('', include(('posts.urls'), namespace='posts')),